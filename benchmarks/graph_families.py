@@ -0,0 +1,79 @@
+"""
+Synthetic graph families shared by the benchmark scripts.
+
+Each generator returns (CSR adjacency, ground-truth labels) and is
+deterministic in seed.
+"""
+import os
+import sys
+
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+from scipy.spatial import cKDTree
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.sparse_graph import as_csr, edges_to_csr
+
+
+def sbm_graph(N, seed, n_blocks=None, avg_in=16.0, avg_out=2.0):
+    """Sparse SBM with about avg_in intra- and avg_out inter-block edges per node, sampled in O(E)."""
+    n_blocks = n_blocks or max(3, int(round(N ** 0.5 / 3)))
+    rng = np.random.default_rng(seed)
+    bounds = np.linspace(0, N, n_blocks + 1).astype(np.int64)
+    block = N / n_blocks
+    p_in = min(1.0, avg_in / block)
+    p_out = min(1.0, avg_out / (N - block))
+    edges = []
+    for a in range(n_blocks):
+        for b in range(a, n_blocks):
+            size_a, size_b = bounds[a + 1] - bounds[a], bounds[b + 1] - bounds[b]
+            pairs = size_a * (size_a - 1) // 2 if a == b else size_a * size_b
+            m = rng.binomial(pairs, p_in if a == b else p_out)
+            u = rng.integers(bounds[a], bounds[a + 1], m)
+            v = rng.integers(bounds[b], bounds[b + 1], m)
+            edges.append(np.stack([u, v], axis=1)[u != v])
+    edges = np.unique(np.sort(np.concatenate(edges), axis=1), axis=0)
+    gt = np.repeat(np.arange(n_blocks), np.diff(bounds))
+    return as_csr(edges_to_csr(edges, N)), gt
+
+
+def lfr_graph(N, seed, mu=0.1, max_tries=10):
+    """
+    NetworkX LFR benchmark graph; the generator often fails to converge, so later seeds
+    are tried in turn. Generation is slow at scale (minutes at N=10^5): use --cache-dir.
+    """
+    for attempt in range(max_tries):
+        try:
+            G = nx.LFR_benchmark_graph(N, 2.5, 1.5, mu, average_degree=10, max_degree=max(30, N // 50),
+                                       min_community=max(10, N // 100), max_community=max(50, N // 10),
+                                       seed=seed + attempt)
+            break
+        except nx.ExceededMaxIterations:
+            continue
+    else:
+        raise RuntimeError(f"LFR generation failed for N={N}, seeds {seed}..{seed + max_tries - 1}")
+    G.remove_edges_from(nx.selfloop_edges(G))
+    communities = {}
+    gt = np.array([communities.setdefault(min(G.nodes[v]['community']), len(communities))
+                   for v in range(N)])
+    return as_csr(nx.to_scipy_sparse_array(G, nodelist=range(N), dtype=np.float64)), gt
+
+
+def knn_graph(N, seed, k=10, dim=4):
+    """
+    State-similarity graph as built from RL rollouts: Gaussian state clusters
+    joined by k-nearest-neighbour edges with RBF weights exp(-distance).
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = max(3, int(round(N ** 0.5 / 3)))
+    gt = rng.integers(0, n_clusters, N)
+    centers = rng.uniform(-10, 10, (n_clusters, dim))
+    states = centers[gt] + rng.normal(0, 1.0, (N, dim))
+    dist, nbr = cKDTree(states).query(states, k=min(k, N - 1) + 1)
+    rows = np.repeat(np.arange(N), nbr.shape[1] - 1)
+    knn = sp.csr_matrix((np.exp(-dist[:, 1:].ravel()), (rows, nbr[:, 1:].ravel())), shape=(N, N))
+    return as_csr(knn.maximum(knn.T)), gt
+
+
+FAMILIES = {"sbm": sbm_graph, "lfr": lfr_graph, "knn": knn_graph}
@@ -0,0 +1,175 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import networkx as nx
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sip import PartitionTree
+from core.entropy import batch_entropy
+from core.greedy_si import GreedySIOptimizer
+from core.louvain_optimizer import SILouvainArrayPass, SILouvainOptimizer, SILouvainOptimizerPass
+from core.si_base import StructuralEntropyBase
+from core.sparse_graph import adjacency_arrays
+from graph_families import sbm_graph
+
+
+def sbm_adj(N, seed=42):
+    """CSR adjacency of the 10-block SBM (graph_families.sbm_graph) that the timings below run on."""
+    return sbm_graph(N, seed, n_blocks=10)[0]
+
+
+def sbm_nx_graph(N, seed=42):
+    G = nx.from_scipy_sparse_array(sbm_adj(N, seed))
+    return nx.Graph(G)
+
+
+def bench_sip(sizes, k, repeat, workers=(1,)):
+    print(f"{'N':>8} {'E':>9} {'k':>3} {'workers':>7} {'best (s)':>10} {'entropy':>10}")
+    for N in sizes:
+        adj = sbm_adj(N)
+        for w in workers:
+            times = []
+            for _ in range(repeat):
+                tree = PartitionTree(adj, workers=w)
+                start = time.perf_counter()
+                tree.build_encoding_tree(k)
+                times.append(time.perf_counter() - start)
+            print(f"{N:>8} {adj.nnz // 2:>9} {k:>3} {w:>7} {min(times):>10.3f} {tree.entropy():>10.4f}")
+
+
+def bench_louvain(sizes, skip_python):
+    """Single-level node-move pass: NetworkX SILouvainOptimizerPass vs numba SILouvainArrayPass."""
+    print(f"{'N':>8} {'E':>9} {'python (s)':>11} {'numba (s)':>10} {'speedup':>8} {'same':>5}")
+    for N in sizes:
+        G = sbm_nx_graph(N)
+        nodes, indptr, indices, data = adjacency_arrays(G)
+        SILouvainArrayPass(indptr, indices, data).optimize()  # JIT warmup
+
+        start = time.perf_counter()
+        labels = SILouvainArrayPass(indptr, indices, data).optimize()
+        t_numba = time.perf_counter() - start
+
+        if skip_python:
+            print(f"{N:>8} {G.number_of_edges():>9} {'-':>11} {t_numba:>10.3f} {'-':>8} {'-':>5}")
+            continue
+        start = time.perf_counter()
+        partition = SILouvainOptimizerPass(G).optimize()
+        t_python = time.perf_counter() - start
+        same = all(partition[nodes[i]] == nodes[c] for i, c in enumerate(labels.tolist()))
+        print(f"{N:>8} {G.number_of_edges():>9} {t_python:>11.3f} {t_numba:>10.3f} "
+              f"{t_python / t_numba:>7.1f}x {str(same):>5}")
+
+
+def bench_heap(sizes, m):
+    """Merge-heap size, time and peak memory with and without stale-entry compaction on hub-heavy BA graphs."""
+    print(f"{'method':>8} {'N':>7} {'compact':>8} {'time (s)':>9} {'peak heap':>10} {'pushes':>9} "
+          f"{'stale pops':>11} {'rebuilds':>9} {'peak MB':>8}")
+    for N in sizes:
+        adj = nx.to_scipy_sparse_array(nx.barabasi_albert_graph(N, m, seed=42), dtype=np.float64)
+        for method in ("greedy", "sip"):
+            for ratio in (None, 0.5):
+                tracemalloc.start()
+                start = time.perf_counter()
+                if method == "greedy":
+                    opt = GreedySIOptimizer(adj, compact_ratio=ratio)
+                    opt.run()
+                    stats = opt.heap_stats
+                else:
+                    tree = PartitionTree(adj, compact_ratio=ratio)
+                    tree.build_encoding_tree(2)
+                    stats = tree.heap_stats[0]
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                tracemalloc.stop()
+                print(f"{method:>8} {N:>7} {str(ratio):>8} {elapsed:>9.2f} {stats['peak_size']:>10} "
+                      f"{stats['pushes']:>9} {stats['stale_pops']:>11} {stats['compactions']:>9} {peak:>8.1f}")
+
+
+def bench_profile(method, N, k):
+    """Per-phase wall time and hot-path counters of one profiled run on an SBM graph (after a small JIT warmup)."""
+    for adj, profile in ((sbm_adj(200), False), (sbm_adj(N), True)):
+        if method == "sip":
+            runner = PartitionTree(adj, profile=profile)
+            runner.build_encoding_tree(k)
+        elif method == "greedy":
+            runner = GreedySIOptimizer(adj, profile=profile)
+            runner.run()
+        else:
+            engine = method.split("-")[1]
+            runner = SILouvainOptimizer(nx.from_scipy_sparse_array(adj) if engine == "python" else adj,
+                                        profile=profile)
+            runner.run(engine=engine)
+    print(f"{method} N={N} E={adj.nnz // 2}")
+    print(runner.stats.report())
+
+
+def bench_entropy(N, n_candidates, n_loop):
+    """Score perturbed candidate partitions: batch_entropy vs one StructuralEntropyBase rebuild per candidate."""
+    adj = sbm_adj(N)
+    G = nx.from_scipy_sparse_array(adj)
+    rng = np.random.default_rng(0)
+    base = np.arange(N) * 10 // N
+    rows = np.repeat(base[None, :], n_candidates, axis=0)
+    flip = rng.random(rows.shape) < 0.05
+    rows[flip] = rng.integers(0, 10, flip.sum())
+    batch_entropy(adj, rows[:2])  # JIT warmup
+
+    start = time.perf_counter()
+    scores = batch_entropy(adj, rows)
+    t_batch = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for row, h in zip(rows[:n_loop], scores[:n_loop]):
+        se = StructuralEntropyBase(G)
+        se.set_partition(dict(enumerate(row.tolist())))
+        assert abs(se.get_total_entropy() - h) < 1e-9
+    t_loop = (time.perf_counter() - start) / n_loop * n_candidates
+    print(f"N={N} E={adj.nnz // 2} candidates={n_candidates}")
+    print(f"  batch_entropy : {t_batch:.3f} s ({n_candidates / t_batch:,.0f} candidates/s)")
+    print(f"  per-partition : {t_loop:.3f} s (extrapolated from {n_loop})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for SI optimizer hot paths")
+    sub = parser.add_subparsers(dest="target", required=True)
+
+    p_sip = sub.add_parser("sip", help="PartitionTree.build_encoding_tree on SBM graphs")
+    p_sip.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000])
+    p_sip.add_argument("-k", type=int, default=2)
+    p_sip.add_argument("--repeat", type=int, default=3)
+    p_sip.add_argument("--workers", type=int, nargs="+", default=[1],
+                       help="leaf_up process counts to compare (only used for k > 2)")
+
+    p_louvain = sub.add_parser("louvain", help="single-level SI Louvain pass, python vs numba engine")
+    p_louvain.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000, 100000])
+    p_louvain.add_argument("--skip-python", action="store_true")
+
+    p_heap = sub.add_parser("heap", help="merge-heap growth with and without stale-entry compaction")
+    p_heap.add_argument("--sizes", type=int, nargs="+", default=[2000, 5000])
+    p_heap.add_argument("-m", type=int, default=5, help="Barabasi-Albert edges per new node")
+
+    p_entropy = sub.add_parser("entropy", help="batched 2D entropy of many candidate partitions")
+    p_entropy.add_argument("-N", type=int, default=2000)
+    p_entropy.add_argument("--candidates", type=int, default=5000)
+    p_entropy.add_argument("--loop", type=int, default=20, help="candidates scored one at a time for comparison")
+
+    p_profile = sub.add_parser("profile", help="phase times and counters of one instrumented run")
+    p_profile.add_argument("method", choices=["sip", "greedy", "louvain-numba", "louvain-python"])
+    p_profile.add_argument("-N", type=int, default=5000)
+    p_profile.add_argument("-k", type=int, default=3, help="encoding tree height (sip)")
+
+    args = parser.parse_args()
+    if args.target == "sip":
+        bench_sip(args.sizes, args.k, args.repeat, args.workers)
+    elif args.target == "louvain":
+        bench_louvain(args.sizes, args.skip_python)
+    elif args.target == "heap":
+        bench_heap(args.sizes, args.m)
+    elif args.target == "entropy":
+        bench_entropy(args.N, args.candidates, args.loop)
+    elif args.target == "profile":
+        bench_profile(args.method, args.N, args.k)
@@ -1,209 +1,456 @@
+"""
+Scalability benchmark for the SI optimizers.
+
+Runs every method on every (graph family, N, seed) combination, times it with
+warmup and repeats, records peak memory and result quality, and writes the
+records as JSON for regression tracking:
+
+    python benchmarks/run_benchmark.py --sizes 100 1000 10000 100000 \
+        --families sbm lfr knn --repeat 3 --output results.json
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
 import time
-import numpy as np
+import tracemalloc
+from datetime import datetime, timezone
+
 import networkx as nx
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.metrics import normalized_mutual_info_score, adjusted_rand_score
-from cdlib import algorithms, evaluation, NodeClustering
-import sys
-import os
+import numpy as np
 
 # Import our SI implementations
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from core.louvain_optimizer import SILouvainOptimizer
 from core.greedy_si import GreedySIOptimizer
+from core.entropy import batch_entropy
+from core.graph_io import load_csr, write_csr
+from graph_families import FAMILIES
 from sip import PartitionTree
 
-def get_node_clustering(partition_dict, G):
-    """Convert partition dict to cdlib NodeClustering object."""
-    communities = {}
-    for node, comm in partition_dict.items():
-        if comm not in communities:
-            communities[comm] = []
-        communities[comm].append(node)
-    return NodeClustering(list(communities.values()), G)
+try:
+    from sklearn.metrics import normalized_mutual_info_score, adjusted_rand_score
+    SKLEARN_AVAILABLE = True
+except ImportError:
+    SKLEARN_AVAILABLE = False
+
+try:
+    from cdlib import algorithms
+    CDLIB_AVAILABLE = True
+except ImportError:
+    CDLIB_AVAILABLE = False
+
+RESULTS_VERSION = 1
+
 
 def calculate_structural_entropy(G, partition_dict):
     """
     Calculate 2D structural entropy H(G, P) as per sip.py / SI theory.
     H(G, P) = sum_{C in P} - (g_C / VOL) * log2(V_C / VOL)
+    G may be a NetworkX graph or a CSR adjacency (partition indexed by row then).
     """
-    vol_total = G.size(weight='weight') * 2
-    if vol_total == 0:
-        return 0
-    
-    # Group nodes by community
-    communities = {}
-    for node, comm in partition_dict.items():
-        if comm not in communities:
-            communities[comm] = []
-        communities[comm].append(node)
-        
-    se = 0.0
-    for comm_nodes in communities.values():
-        # Volume of community (sum of degrees)
-        v_c = sum(dict(G.degree(comm_nodes, weight='weight')).values())
-        # Cut of community (edges leaving)
-        g_c = nx.cut_size(G, comm_nodes, weight='weight')
-        
-        if v_c > 0:
-            se += - (g_c / vol_total) * np.log2(v_c / vol_total)
-            
-    return se
-
-def benchmark_clustering():
-    # Adjusted scales to run faster while verifying accuracy
-    scales = [100, 200, 300] 
-    all_results = []
-    viz_data = {} # To store partition for N=100 for visualization
-    
-    for N in scales:
-        print(f"\n--- Benchmarking Scale N={N} ---")
-        sizes = [N//3, N//3, N - 2*(N//3)]
-        probs = [[0.2, 0.01, 0.01], [0.01, 0.2, 0.01], [0.01, 0.01, 0.2]]
-        G_raw = nx.stochastic_block_model(sizes, probs, seed=42)
-        G = nx.Graph()
-        G.add_nodes_from(G_raw.nodes())
-        G.add_edges_from(G_raw.edges())
-        
-        gt_labels = []
-        for i, size in enumerate(sizes):
-            gt_labels.extend([i] * size)
-        
-        if N == 100:
-            viz_data['G'] = G
-            viz_data['gt'] = gt_labels
-            viz_data['partitions'] = {}
-
-        methods = [
-            ("SI Louvain (Refactored)", "si_louvain"),
-            ("SI Greedy (Refactored)", "si_greedy"),
-            ("SIHD (Original sip.py)", "sihd_orig"),
-            ("Leiden", "leiden"),
-        ]
-
-        for name, key in methods:
-            print(f"Running {name}...")
-            start = time.time()
-            try:
-                if key == "si_louvain":
-                    partition_dict = SILouvainOptimizer(G).run()
-                elif key == "si_greedy":
-                    # target_communities=3 for fair ground truth comparison
-                    partition_dict = GreedySIOptimizer(G).run(target_communities=3)
-                elif key == "sihd_orig":
-                    adj = nx.to_numpy_array(G)
-                    tree = PartitionTree(adj)
-                    # For comparison with 3-community SBM, k=2 should find the top-level
-                    tree.build_encoding_tree(k=2)
-                    root_node = tree.tree_node[tree.root_id]
-                    partition_dict = {}
-                    for i, c_id in enumerate(root_node.children):
-                        for node in tree.tree_node[c_id].partition:
-                            partition_dict[node] = i
-                elif key == "leiden":
-                    clustering_obj = algorithms.leiden(G)
-                    partition_dict = {node: i for i, comm in enumerate(clustering_obj.communities) for node in comm}
-                
-                exec_time = time.time() - start
-                
-                # Store visualization sample
-                if N == 100:
-                    viz_data['partitions'][name] = partition_dict
-
-                clustering_obj = get_node_clustering(partition_dict, G)
-                
-                # Accuracy Labels
-                pred_labels = [partition_dict[i] for i in range(N)]
-                
-                # Metrics
-                nmi = normalized_mutual_info_score(gt_labels, pred_labels)
-                ari = adjusted_rand_score(gt_labels, pred_labels)
-                mod = evaluation.newman_girvan_modularity(G, clustering_obj).score
-                se = calculate_structural_entropy(G, partition_dict)
-                
-                all_results.append({
-                    "Scale": N,
-                    "Method": name,
-                    "Time (s)": exec_time,
-                    "NMI": nmi,
-                    "ARI": ari,
-                    "Modularity": mod,
-                    "Structural Entropy": se,
-                    "Communities": len(clustering_obj.communities)
-                })
-            except Exception as e:
-                print(f"Error in {name}: {e}")
-
-    df = pd.DataFrame(all_results)
-    print("\n=== Comprehensive SI-Variant Comparison ===")
-    print(df.to_string(index=False))
-    
-    df.to_csv("/workspace/SI-Lab/benchmarks/benchmark_results.csv", index=False)
-    
-    # Visualizations
-    sns.set_theme(style="whitegrid")
-    fig, axes = plt.subplots(2, 3, figsize=(20, 12))
-    
-    sns.lineplot(ax=axes[0, 0], data=df, x="Scale", y="Time (s)", hue="Method", marker='o')
-    axes[0, 0].set_yscale('log')
-    axes[0, 0].set_title("Execution Time [Lower is Better ↓]")
-
-    sns.barplot(ax=axes[0, 1], data=df, x="Scale", y="NMI", hue="Method")
-    axes[0, 1].set_title("NMI Accuracy [Higher is Better ↑]")
-
-    sns.barplot(ax=axes[0, 2], data=df, x="Scale", y="Structural Entropy", hue="Method")
-    axes[0, 2].set_title("Structural Entropy [Minimize is Better ↓]")
-
-    sns.barplot(ax=axes[1, 0], data=df, x="Scale", y="ARI", hue="Method")
-    axes[1, 0].set_title("ARI Accuracy [Higher is Better ↑]")
-
-    sns.barplot(ax=axes[1, 1], data=df, x="Scale", y="Modularity", hue="Method")
-    axes[1, 1].set_title("Structural Quality (Modularity)")
-    
-    sns.barplot(ax=axes[1, 2], data=df, x="Scale", y="Communities", hue="Method")
-    axes[1, 2].set_title("Number of Communities")
-
-    plt.tight_layout()
-    plt.savefig("/workspace/SI-Lab/benchmarks/si_comparison_plot.png")
-    print(f"\nReport saved to /workspace/SI-Lab/benchmarks/si_comparison_plot.png")
-
-    # --- Community Visualization Plot ---
-    if 'G' in viz_data:
-        print("Generating community visualization plots...")
-        G = viz_data['G']
-        pos = nx.spring_layout(G, seed=42)
-        methods_to_plot = list(viz_data['partitions'].keys())
-        n_methods = len(methods_to_plot) + 1 # +1 for Ground Truth
-        
-        fig, axes = plt.subplots(1, n_methods, figsize=(5 * n_methods, 5))
-        
-        # Plot Ground Truth
-        nx.draw_networkx_nodes(G, pos, node_size=50, node_color=viz_data['gt'], cmap=plt.cm.jet, ax=axes[0])
-        nx.draw_networkx_edges(G, pos, alpha=0.2, ax=axes[0])
-        axes[0].set_title("Ground Truth (N=100)")
-        axes[0].axis('off')
-
-        # Plot each method
-        for i, name in enumerate(methods_to_plot):
-            ax = axes[i+1]
-            partition = viz_data['partitions'][name]
-            node_colors = [partition[node] for node in G.nodes()]
-            nx.draw_networkx_nodes(G, pos, node_size=50, node_color=node_colors, cmap=plt.cm.jet, ax=ax)
-            nx.draw_networkx_edges(G, pos, alpha=0.2, ax=ax)
-            ax.set_title(f"{name}")
-            ax.axis('off')
-        
-        plt.tight_layout()
-        plt.savefig("/workspace/SI-Lab/benchmarks/community_visualization.png")
-        print(f"Community visualization saved to /workspace/SI-Lab/benchmarks/community_visualization.png")
+    nodes = G.nodes() if isinstance(G, nx.Graph) else range(G.shape[0])
+    labels = [partition_dict[node] for node in nodes]
+    return batch_entropy(G, labels, node_terms=False)
 
-if __name__ == "__main__":
-    benchmark_clustering()
 
+def load_graph(family, N, seed, cache_dir=None):
+    """Build a benchmark graph, or read it back from cache_dir (core.graph_io format) when cached there."""
+    if cache_dir is None:
+        return FAMILIES[family](N, seed)
+    path = os.path.join(cache_dir, f"{family}-{N}-{seed}")
+    if os.path.exists(os.path.join(path, "meta.json")):
+        return load_csr(path, mmap=False), np.load(os.path.join(path, "gt.npy"))
+    adj, gt = FAMILIES[family](N, seed)
+    write_csr(adj, path)
+    np.save(os.path.join(path, "gt.npy"), gt)
+    return adj, gt
 
-if __name__ == "__main__":
-    benchmark_clustering()
+
+# --- Methods ---
+# Each takes (adj, ground truth, profile) and returns (one community label per node,
+# the optimizer's core.profiling stats or None).
+
+def run_si_louvain(adj, gt, profile=False):
+    optimizer = SILouvainOptimizer(adj, profile=profile)
+    return optimizer.run(), optimizer.stats
+
+
+def run_si_greedy(adj, gt, profile=False):
+    optimizer = GreedySIOptimizer(adj, profile=profile)
+    # target the ground-truth community count for a fair comparison
+    partition = optimizer.run(target_communities=len(np.unique(gt)))
+    return np.array([partition[i] for i in range(adj.shape[0])]), optimizer.stats
+
+
+def run_sihd(adj, gt, profile=False):
+    tree = PartitionTree(adj, profile=profile)
+    # k=2: the root's children are the top-level communities
+    tree.build_encoding_tree(k=2)
+    labels = np.zeros(adj.shape[0], dtype=np.int64)
+    for i, c_id in enumerate(tree.tree_node[tree.root_id].children):
+        labels[list(tree.tree_node[c_id].partition)] = i
+    return labels, tree.stats
+
+
+def run_leiden(adj, gt, profile=False):
+    communities = algorithms.leiden(nx.from_scipy_sparse_array(adj)).communities
+    labels = np.zeros(adj.shape[0], dtype=np.int64)
+    for i, comm in enumerate(communities):
+        labels[comm] = i
+    return labels, None
+
+
+METHODS = {
+    "si_louvain": run_si_louvain,
+    "si_greedy": run_si_greedy,
+    "sihd": run_sihd,
+    "leiden": run_leiden,
+}
+
+
+# --- Measurement ---
+
+def _reset_peak_rss():
+    """Reset the kernel's RSS high-water mark (Linux); returns False where that is not possible."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _proc_status_mb(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss_mb():
+    peak = _proc_status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    # Process-wide peak: KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def measure(fn, repeat=3, warmup=1, memory=True):
+    """
+    Time fn() `repeat` times after `warmup` untimed calls (JIT compilation, caches).
+    rss_peak_mb is the largest resident-set high-water mark over the timed calls (the
+    process-wide peak where it cannot be reset), rss_base_mb the resident set before
+    them. tracemalloc_peak_mb (Python / NumPy allocations) is taken in one extra call,
+    so tracemalloc overhead never reaches the timings.
+    Returns (result of the last call, stats dict).
+    """
+    for _ in range(warmup):
+        result = fn()
+    times = []
+    rss_reset = True
+    rss_peak = 0.0
+    gc.collect()
+    rss_base = _proc_status_mb("VmRSS")
+    for _ in range(repeat):
+        gc.collect()
+        if memory:
+            rss_reset = _reset_peak_rss() and rss_reset
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+        if memory:
+            rss_peak = max(rss_peak, _peak_rss_mb())
+    stats = {
+        "times": times,
+        "time_min": min(times),
+        "time_median": statistics.median(times),
+        "time_stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+    if memory:
+        stats["rss_base_mb"] = rss_base
+        stats["rss_peak_mb"] = rss_peak
+        stats["rss_peak_is_process_peak"] = not rss_reset
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        stats["tracemalloc_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result, stats
 
 
+def quality(adj, gt, labels):
+    """Entropy and community count of a labelling, plus NMI / ARI / modularity against the ground truth."""
+    labels = np.asarray(labels)
+    _, compact = np.unique(labels, return_inverse=True)
+    record = {
+        "entropy": calculate_structural_entropy(adj, labels),
+        "communities": int(compact.max()) + 1 if len(compact) else 0,
+    }
+    if SKLEARN_AVAILABLE:
+        record["nmi"] = normalized_mutual_info_score(gt, compact)
+        record["ari"] = adjusted_rand_score(gt, compact)
+    # Modularity Q = sum_C [l_C / m - (d_C / 2m)^2], in O(E) on the CSR arrays
+    degree = np.asarray(adj.sum(axis=1)).ravel()
+    two_m = degree.sum()
+    if two_m > 0:
+        rows = np.repeat(np.arange(adj.shape[0]), np.diff(adj.indptr))
+        inside = adj.data[compact[rows] == compact[adj.indices]].sum()
+        d_c = np.bincount(compact, weights=degree)
+        record["modularity"] = float(inside / two_m - ((d_c / two_m) ** 2).sum())
+    return record
+
+
+def environment():
+    """Machine and code version the results were produced on."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "networkx": nx.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def record_key(record):
+    return record["family"], record["N"], record["seed"], record["method"]
+
+
+def run_suite(families, sizes, methods, seeds, repeat=3, warmup=1, budget=None, memory=True,
+              profile=False, cache_dir=None, only=None, log=lambda line: print(line, flush=True)):
+    """
+    Benchmark every method on every (family, N, seed) graph, sizes ascending.
+    budget: seconds; once a method's median time exceeds it, its larger sizes are skipped
+    (recorded with status "skipped") so one slow method cannot stall the sweep.
+    profile: add one untimed profiled run per record and store its counters and phase
+    times (Profiler.to_dict()) under "profile".
+    only: optional set of record_key() tuples; other combinations are not run or recorded.
+    Returns the list of result records.
+    """
+    records = []
+    for family in families:
+        over_budget = set()
+        for N in sorted(sizes):
+            for seed in seeds:
+                if only is not None and not any((family, N, seed, m) in only for m in methods):
+                    continue
+                start = time.perf_counter()
+                adj, gt = load_graph(family, N, seed, cache_dir)
+                log(f"[{family} N={N} seed={seed}] E={adj.nnz // 2} ready in {time.perf_counter() - start:.2f}s")
+                for method in methods:
+                    record = {"family": family, "N": N, "E": int(adj.nnz // 2), "seed": seed, "method": method}
+                    if only is not None and record_key(record) not in only:
+                        continue
+                    if method in over_budget:
+                        record["status"] = "skipped"
+                        records.append(record)
+                        continue
+                    try:
+                        labels, stats = measure(lambda: METHODS[method](adj, gt)[0], repeat, warmup, memory)
+                        record.update(stats)
+                        record.update(quality(adj, gt, labels))
+                        if profile:
+                            profiler = METHODS[method](adj, gt, profile=True)[1]
+                            record["profile"] = profiler.to_dict() if profiler is not None else None
+                        record["status"] = "ok"
+                        if budget is not None and stats["time_median"] > budget:
+                            over_budget.add(method)
+                    except Exception as e:
+                        record["status"] = "error"
+                        record["error"] = f"{type(e).__name__}: {e}"
+                    records.append(record)
+                    log(format_record(record))
+    return records
+
+
+def format_record(record):
+    if record["status"] != "ok":
+        return f"  {record['method']:<11} {record['status']} {record.get('error', '')}"
+    extra = "".join(f" {key}={record[key]:.3f}" for key in ("nmi", "modularity") if key in record)
+    memory = f" mem={record['tracemalloc_peak_mb']:.1f}MB rss=+{record['rss_peak_mb'] - record['rss_base_mb']:.0f}MB" \
+        if record.get("rss_base_mb") is not None else ""
+    return (f"  {record['method']:<11} {record['time_median']:9.4f}s (min {record['time_min']:.4f})"
+            f"{memory} H={record['entropy']:.4f} C={record['communities']}{extra}")
+
+
+def load_results(path):
+    with open(path) as f:
+        results = json.load(f)
+    if results.get("version") != RESULTS_VERSION:
+        raise ValueError(f"{path}: unsupported results version {results.get('version')}")
+    return results
+
+
+def compare_records(base, new, time_tolerance=0.15, noise_sigma=3.0, min_time=0.005,
+                    memory_tolerance=0.15, min_memory_mb=1.0, entropy_tolerance=1e-6):
+    """
+    Compare one rerun record against its baseline; returns a row of deltas and a verdict.
+
+    A slowdown only counts when the median time grows by more than time_tolerance
+    (relative), by more than noise_sigma combined standard deviations of the two runs
+    and by more than min_time seconds, so jitter on short or noisy runs does not trip
+    the gate. Memory (tracemalloc peak, which unlike RSS is reproducible) regresses
+    past memory_tolerance and min_memory_mb; entropy (lower is better) past
+    entropy_tolerance. A method that ran in the baseline but now fails also regresses.
+    """
+    row = {key: new[key] for key in ("family", "N", "seed", "method")}
+    if new["status"] != "ok":
+        row.update(verdict="regression", reasons=[f"now {new['status']}: {new.get('error', '')}".strip()])
+        return row
+    reasons, improvements = [], []
+
+    dt = new["time_median"] - base["time_median"]
+    noise = noise_sigma * math.hypot(base.get("time_stdev", 0.0), new.get("time_stdev", 0.0))
+    row.update(time_base=base["time_median"], time_new=new["time_median"],
+               time_ratio=new["time_median"] / base["time_median"] if base["time_median"] > 0 else None)
+    if abs(dt) > max(time_tolerance * base["time_median"], noise, min_time):
+        (reasons if dt > 0 else improvements).append("time")
+
+    if "tracemalloc_peak_mb" in base and "tracemalloc_peak_mb" in new:
+        dm = new["tracemalloc_peak_mb"] - base["tracemalloc_peak_mb"]
+        row.update(memory_base=base["tracemalloc_peak_mb"], memory_new=new["tracemalloc_peak_mb"],
+                   rss_base=base.get("rss_peak_mb"), rss_new=new.get("rss_peak_mb"))
+        if abs(dm) > max(memory_tolerance * base["tracemalloc_peak_mb"], min_memory_mb):
+            (reasons if dm > 0 else improvements).append("memory")
+
+    dh = new["entropy"] - base["entropy"]
+    row.update(entropy_base=base["entropy"], entropy_new=new["entropy"])
+    if abs(dh) > entropy_tolerance:
+        (reasons if dh > 0 else improvements).append("entropy")
+
+    if new["E"] != base["E"]:
+        row["warning"] = f"graph changed (E {base['E']} -> {new['E']})"
+    row["verdict"] = "regression" if reasons else "improved" if improvements else "ok"
+    row["reasons"] = reasons or improvements
+    return row
+
+
+def compare_results(baseline, records, **thresholds):
+    """compare_records() for every baseline record that ran, matched to records by record_key()."""
+    new = {record_key(r): r for r in records}
+    rows = []
+    for base in baseline["results"]:
+        if base["status"] == "ok" and record_key(base) in new:
+            rows.append(compare_records(base, new[record_key(base)], **thresholds))
+    return rows
+
+
+def format_comparison(rows):
+    lines = [f"{'family':<6} {'N':>7} {'seed':>5} {'method':<11} {'time base -> new (s)':>31} "
+             f"{'memory base -> new (MB)':>23} {'entropy delta':>13}  verdict"]
+    for row in rows:
+        head = f"{row['family']:<6} {row['N']:>7} {row['seed']:>5} {row['method']:<11}"
+        if "time_new" not in row:
+            lines.append(f"{head} {'':>69}  {row['verdict']} ({'; '.join(row['reasons'])})")
+            continue
+        ratio = f"{row['time_ratio']:.2f}x" if row["time_ratio"] is not None else "-"
+        time_col = f"{row['time_base']:.4f} -> {row['time_new']:.4f} ({ratio})"
+        memory = f"{row['memory_base']:.1f} -> {row['memory_new']:.1f}" if "memory_new" in row else "-"
+        verdict = row["verdict"] + (f" ({', '.join(row['reasons'])})" if row["reasons"] else "")
+        if "warning" in row:
+            verdict += f" [{row['warning']}]"
+        lines.append(f"{head} {time_col:>31} {memory:>23} {row['entropy_new'] - row['entropy_base']:>+13.2e}  {verdict}")
+    return "\n".join(lines)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Scalability benchmark for the SI optimizers")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--families", nargs="+", choices=sorted(FAMILIES), default=["sbm", "lfr", "knn"])
+    parser.add_argument("--methods", nargs="+", choices=sorted(METHODS),
+                        default=[m for m in METHODS if m != "leiden" or CDLIB_AVAILABLE])
+    parser.add_argument("--seeds", type=int, nargs="+", default=[42])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--budget", type=float, default=60.0,
+                        help="skip larger sizes of a method once its median time exceeds this many seconds")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc / RSS tracking")
+    parser.add_argument("--profile", action="store_true",
+                        help="record per-phase times and hot-path counters (one extra untimed run)")
+    parser.add_argument("--cache-dir", help="keep generated graphs here and reuse them on later runs")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+
+    gate = parser.add_argument_group("regression gate")
+    gate.add_argument("--compare", metavar="BASELINE",
+                      help="rerun the graphs, seeds and methods of a previous --output file and "
+                           "exit with status 1 on a regression (--families/--sizes/--methods/--seeds "
+                           "narrow the rerun)")
+    gate.add_argument("--time-tolerance", type=float, default=0.15, help="relative median-time slack")
+    gate.add_argument("--noise-sigma", type=float, default=3.0,
+                      help="slowdowns within this many combined stdevs are treated as noise")
+    gate.add_argument("--min-time", type=float, default=0.005, help="absolute time slack in seconds")
+    gate.add_argument("--memory-tolerance", type=float, default=0.15, help="relative tracemalloc-peak slack")
+    gate.add_argument("--min-memory", type=float, default=1.0, help="absolute memory slack in MB")
+    gate.add_argument("--entropy-tolerance", type=float, default=1e-6, help="absolute entropy slack")
+    return parser
+
+
+def main(argv=None):
+    """Run the benchmark; returns the process exit status (1 when --compare finds a regression)."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    config = {"sizes": args.sizes, "families": args.families, "methods": args.methods, "seeds": args.seeds,
+              "repeat": args.repeat, "warmup": args.warmup, "budget": args.budget, "memory": not args.no_memory,
+              "profile": args.profile}
+    only = baseline = None
+    if args.compare:
+        baseline = load_results(args.compare)
+        # Rerun the baseline's own combinations, with its repeat / warmup, minus what the flags filter out
+        explicit = {key for key in ("sizes", "families", "methods", "seeds")
+                    if getattr(args, key) != parser.get_default(key)}
+        for key, value in baseline["config"].items():
+            if key not in explicit:
+                config[key] = value
+        config["budget"] = None
+        config["memory"] = config["memory"] and not args.no_memory
+        config["profile"] = config.get("profile", False) or args.profile
+        only = {record_key(r) for r in baseline["results"] if r["status"] == "ok"}
+
+    records = run_suite(config["families"], config["sizes"], config["methods"], config["seeds"],
+                        repeat=config["repeat"], warmup=config["warmup"], budget=config["budget"],
+                        memory=config["memory"], profile=config.get("profile", False), cache_dir=args.cache_dir,
+                        only=only)
+    results = {
+        "version": RESULTS_VERSION,
+        "environment": environment(),
+        "config": config,
+        "results": records,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+    if baseline is None:
+        return 0
+
+    rows = compare_results(baseline, records, time_tolerance=args.time_tolerance, noise_sigma=args.noise_sigma,
+                           min_time=args.min_time, memory_tolerance=args.memory_tolerance,
+                           min_memory_mb=args.min_memory, entropy_tolerance=args.entropy_tolerance)
+    base_env = baseline["environment"]
+    print(f"\n=== Compared with {args.compare} (commit {base_env.get('commit')}, {base_env.get('timestamp')}) ===")
+    print(format_comparison(rows))
+    regressions = [row for row in rows if row["verdict"] == "regression"]
+    print(f"\n{len(regressions)} regression(s) in {len(rows)} comparisons")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,40 +1,29 @@
 import math
-import heapq
-import numba as nb
+import multiprocessing as mp
+import os
+import sys
+import warnings
 import numpy as np
-import copy
+from concurrent.futures import ProcessPoolExecutor
 
-def get_id():
-    i = 0
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.lazy_heap import LazyHeap
+from core.leaf_order import leaf_ranges
+from core.profiling import Profiler, make_profiler
+from core.sparse_graph import as_csr, edges_to_csr, group_adjacency, induced_subgraph
+
+def get_id(start=0):
+    i = start
     while True:
         yield i
         i += 1
 def graph_parse(adj_matrix):
+    """Parse a CSR adjacency (see as_csr) into the node count, total volume and node volumes."""
+    adj_matrix = as_csr(adj_matrix)
     g_num_nodes = adj_matrix.shape[0]
-    adj_table = {}
-    VOL = 0
-    node_vol = []
-    for i in range(g_num_nodes):
-        n_v = 0
-        adj = set()
-        for j in range(g_num_nodes):
-            if adj_matrix[i,j] != 0:
-                n_v += adj_matrix[i,j]
-                VOL += adj_matrix[i,j]
-                adj.add(j)
-        adj_table[i] = adj
-        node_vol.append(n_v)
-    return g_num_nodes,VOL,node_vol,adj_table
-
-@nb.jit(nopython=True)
-def cut_volume(adj_matrix,p1,p2):
-    c12 = 0
-    for i in range(len(p1)):
-        for j in range(len(p2)):
-            c = adj_matrix[p1[i],p2[j]]
-            if c != 0:
-                c12 += c
-    return c12
+    node_vol = np.asarray(adj_matrix.sum(axis=1)).ravel()
+    VOL = float(node_vol.sum())
+    return g_num_nodes,VOL,node_vol.tolist()
 
 def LayerFirst(node_dict,start_id):
     stack = [start_id]
@@ -46,26 +35,46 @@ def LayerFirst(node_dict,start_id):
                 stack.append(c_id)
 
 
-def merge(new_ID, id1, id2, cut_v, node_dict, adj_matrix):
-    new_partition = node_dict[id1].partition + node_dict[id2].partition
+def merge(new_ID, id1, id2, cut_v, node_dict):
+    # The partition is filled in as a leaf-order slice once the tree is built (assign_partitions)
     v = node_dict[id1].vol + node_dict[id2].vol
-    # modification begining
     g = node_dict[id1].g + node_dict[id2].g - 2 * cut_v
-    # g = 0.0
-    # for nid in new_partition:
-    #     adj_list = adj_matrix[nid]
-    #     for id in range(len(adj_list)):
-    #         if (adj_list[id] > 0.0) and (id not in new_partition):
-    #             g += adj_list[id]
-    # modification ending
     child_h = max(node_dict[id1].child_h,node_dict[id2].child_h) + 1
-    new_node = PartitionTreeNode(ID=new_ID,partition=new_partition,children={id1,id2},
+    new_node = PartitionTreeNode(ID=new_ID,partition=None,children={id1,id2},
                                  g=g, vol=v,child_h= child_h,child_cut = cut_v)
     node_dict[id1].parent = new_ID
     node_dict[id2].parent = new_ID
     node_dict[new_ID] = new_node
 
 
+def shift_ids(node_dict, base, shift):
+    """Renumber the nodes of a subproblem with ids >= base by shift; ids below base are vertices."""
+    def move(i):
+        return i + shift if i is not None and i >= base else i
+    shifted = {}
+    for node in node_dict.values():
+        node.ID = move(node.ID)
+        node.parent = move(node.parent)
+        if node.children:
+            node.children = {move(c) for c in node.children}
+        shifted[node.ID] = node
+    return shifted
+
+
+# Tree whose leaf_up subproblems are being solved; forked workers inherit it instead of unpickling it
+_LEAF_UP_TREE = None
+
+
+def _leaf_up_task(args):
+    node_id, base = args
+    tree = _LEAF_UP_TREE
+    if tree.profiler.enabled:
+        tree.profiler = Profiler()
+    n_stats = len(tree.heap_stats)
+    result = tree.leaf_up_subtree(node_id, base)
+    return result, tree.heap_stats[n_stats:], tree.profiler if tree.profiler.enabled else None
+
+
 def compressNode(node_dict, node_id, parent_id):
     p_child_h = node_dict[parent_id].child_h
     node_children = node_dict[node_id].children
@@ -89,14 +98,54 @@ def compressNode(node_dict, node_id, parent_id):
 
 
 
-def child_tree_deepth(node_dict,nid):
-    node = node_dict[nid]
-    deepth = 0
-    while node.parent is not None:
-        node = node_dict[node.parent]
-        deepth+=1
-    deepth += node_dict[nid].child_h
-    return deepth
+class TreeDepths():
+    """
+    Height of the tree through each internal node (distance from the root plus
+    child_h) while a k-tree is being compressed, in O(log n) per query.
+
+    Compressing a node lifts exactly its current subtree one level. Internal nodes
+    get Euler-tour ranges once, so a compression is a range add on a Fenwick tree
+    and no query walks to the root.
+    """
+    def __init__(self, node_dict, root_id, blocks=()):
+        self.node_dict = node_dict
+        self.tin, self.tout, self.dist = {}, {}, {}
+        stack = [(root_id, 0)]
+        t = 0
+        while stack:
+            nid, d = stack.pop()
+            if d < 0:
+                self.tout[nid] = t
+                continue
+            self.tin[nid], self.dist[nid] = t, d
+            t += 1
+            stack.append((nid, -1))
+            for c in node_dict[nid].children:
+                if c not in blocks and node_dict[c].children:
+                    stack.append((c, d + 1))
+        self.fenwick = [0] * (t + 2)
+
+    def _add(self, i, delta):
+        i += 1
+        while i < len(self.fenwick):
+            self.fenwick[i] += delta
+            i += i & -i
+
+    def _lift(self, i):
+        i += 1
+        s = 0
+        while i > 0:
+            s += self.fenwick[i]
+            i -= i & -i
+        return s
+
+    def compress(self, nid):
+        """nid was compressed away: everything below it moves one level up."""
+        self._add(self.tin[nid], -1)
+        self._add(self.tout[nid], 1)
+
+    def __call__(self, nid):
+        return self.dist[nid] + self._lift(self.tin[nid]) + self.node_dict[nid].child_h
 
 
 def CompressDelta(node1,p_node):
@@ -116,6 +165,9 @@ def CombineDelta(node1, node2, cut_v, g_vol):
 
 
 class PartitionTreeNode():
+    # __slots__ drops the per-node __dict__: trees hold one node per leaf and merge
+    __slots__ = ("ID", "partition", "parent", "children", "vol", "g", "merged", "child_h", "child_cut")
+
     def __init__(self, ID, partition, vol, g, children:set = None,parent = None,child_h = 0, child_cut = 0):
         self.ID = ID
         self.partition = partition
@@ -133,19 +185,59 @@ class PartitionTreeNode():
     def gatherAttrs(self):
         return ",".join("{}={}"
                         .format(k, getattr(self, k))
-                        for k in self.__dict__.keys())
+                        for k in self.__slots__)
 
 class PartitionTree():
 
-    def __init__(self,adj_matrix):
-        self.adj_matrix = adj_matrix
+    def __init__(self,adj_matrix = None,edges = None,num_nodes = None,compact_ratio = 0.5,profile = False,
+                 workers = 1):
+        # adj_matrix: scipy.sparse / dense adjacency; edges: (E, 2) or (E, 3) edge list
+        # compact_ratio: stale-entry share that triggers a merge-heap rebuild (None disables)
+        # profile: True (or a core.profiling.Profiler) records counters and phase times in self.stats
+        # workers: processes solving the leaf_up subproblems of build_encoding_tree (None: all cores)
+        self.compact_ratio = compact_ratio
+        self.workers = workers or os.cpu_count()
+        self.heap_stats = [] # LazyHeap.stats() of every __build_k_tree call
+        self.profiler = make_profiler(profile)
+        self.stats = self.profiler if self.profiler.enabled else None
+        if edges is not None:
+            self.adj_matrix = as_csr(edges_to_csr(edges, num_nodes))
+        else:
+            self.adj_matrix = as_csr(adj_matrix)
         self.tree_node = {}
-        self.g_num_nodes, self.VOL, self.node_vol, self.adj_table = graph_parse(adj_matrix)
+        self.g_num_nodes, self.VOL, self.node_vol = graph_parse(self.adj_matrix)
+        self._adj_table = None
         self.id_g = get_id()
         self.leaves = []
         self.build_leaves()
 
-
+    @property
+    def adj_table(self):
+        """
+        Deprecated: {vertex: set of neighbour vertices} of the input graph, built on
+        first access. The tree itself only reads self.adj_matrix; use that instead.
+        """
+        warnings.warn("PartitionTree.adj_table is deprecated, use the CSR adj_matrix instead",
+                      DeprecationWarning, stacklevel=2)
+        if self._adj_table is None:
+            indptr, indices = self.adj_matrix.indptr, self.adj_matrix.indices
+            self._adj_table = {i: set(indices[indptr[i]:indptr[i + 1]].tolist()) for i in range(self.g_num_nodes)}
+        return self._adj_table
+
+
+
+    def node_cuts(self, nodes_dict):
+        """Cut weight between every pair of nodes in nodes_dict as {id: {id: cut}}, in O(sum of degrees)."""
+        ids = list(nodes_dict.keys())
+        cuts = group_adjacency(self.adj_matrix, [nodes_dict[i].partition for i in ids])
+        self.profiler.count("cut_queries")
+        self.profiler.count("cut_pairs", cuts.nnz)
+        com_adj = {}
+        for a, i in enumerate(ids):
+            start, end = cuts.indptr[a], cuts.indptr[a + 1]
+            com_adj[i] = {ids[b]: c for b, c in zip(cuts.indices[start:end].tolist(), cuts.data[start:end].tolist())
+                          if b != a}
+        return com_adj
 
     def build_leaves(self):
         for vertex in range(self.g_num_nodes):
@@ -157,23 +249,25 @@ class PartitionTree():
 
 
     def build_sub_leaves(self,node_list,p_vol):
+        """
+        Leaves of an h1 community's subproblem and the cuts between them, from its
+        induced subgraph in O(sum of degrees); shared tree state is only read.
+        """
         subgraph_node_dict = {}
+        com_adj = {}
         ori_ent = 0
-        for vertex in node_list:
+        node_list = np.asarray(node_list).tolist()
+        indptr, indices, data, vol = induced_subgraph(self.adj_matrix, node_list)
+        indptr, indices, data = indptr.tolist(), indices.tolist(), data.tolist()
+        for a, (vertex, v) in enumerate(zip(node_list, vol.tolist())):
             ori_ent += -(self.tree_node[vertex].g / self.VOL)\
                        * math.log2(self.tree_node[vertex].vol / p_vol)
-            sub_n = set()
-            vol = 0
-            for vertex_n in node_list:
-                c = self.adj_matrix[vertex,vertex_n]
-                if c != 0:
-                    vol += c
-                    sub_n.add(vertex_n)
-            sub_leaf = PartitionTreeNode(ID=vertex,partition=[vertex],g=vol,vol=vol)
+            start, end = indptr[a], indptr[a + 1]
+            com_adj[vertex] = {node_list[b]: c for b, c in zip(indices[start:end], data[start:end]) if b != a}
+            sub_leaf = PartitionTreeNode(ID=vertex,partition=[vertex],g=v,vol=v)
             subgraph_node_dict[vertex] = sub_leaf
-            self.adj_table[vertex] = sub_n
 
-        return subgraph_node_dict,ori_ent
+        return subgraph_node_dict,ori_ent,com_adj
 
     def build_root_down(self):
         root_child = self.tree_node[self.root_id].children
@@ -183,12 +277,6 @@ class PartitionTree():
         for node_id in root_child:
             node = self.tree_node[node_id]
             ori_en += -(node.g / g_vol) * math.log2(node.vol / g_vol)
-            new_n = set()
-            for nei in self.adj_table[node_id]:
-                if nei in root_child:
-                    new_n.add(nei)
-            self.adj_table[node_id] = new_n
-
             new_node = PartitionTreeNode(ID=node_id,partition=node.partition,vol=node.vol,g = node.g,children=node.children)
             subgraph_node_dict[node_id] = new_node
 
@@ -209,51 +297,66 @@ class PartitionTree():
         return ent
 
 
-    def __build_k_tree(self,g_vol,nodes_dict:dict,k = None,):
+    def __build_k_tree(self,g_vol,nodes_dict:dict,k = None,com_adj = None):
+        # com_adj: cuts between the nodes of nodes_dict as {id: {id: cut}} if already known (see node_cuts)
         min_heap = []
         cmp_heap = []
         nodes_ids = nodes_dict.keys()
         new_id = None
-        for i in nodes_ids:
-            for j in self.adj_table[i]:
-                if j > i:
-                    n1 = nodes_dict[i]
-                    n2 = nodes_dict[j]
-                    if len(n1.partition) == 1 and len(n2.partition) == 1:
-                        cut_v = self.adj_matrix[n1.partition[0],n2.partition[0]]
-                    else:
-                        cut_v = cut_volume(self.adj_matrix,p1 = np.array(n1.partition),p2=np.array(n2.partition))
-                    diff = CombineDelta(nodes_dict[i], nodes_dict[j], cut_v, g_vol)
-                    heapq.heappush(min_heap, (diff, i, j, cut_v))
-        unmerged_count = len(nodes_ids)
-        while unmerged_count > 1:
-            if len(min_heap) == 0:
-                break
-            diff, id1, id2, cut_v = heapq.heappop(min_heap)
-            if nodes_dict[id1].merged or nodes_dict[id2].merged:
-                continue
-            nodes_dict[id1].merged = True
-            nodes_dict[id2].merged = True
-            new_id = next(self.id_g)
-            merge(new_id, id1, id2, cut_v, nodes_dict, self.adj_matrix)
-            self.adj_table[new_id] = self.adj_table[id1].union(self.adj_table[id2])
-            for i in self.adj_table[new_id]:
-                self.adj_table[i].add(new_id)
-            #compress delta
-            if nodes_dict[id1].child_h > 0:
-                heapq.heappush(cmp_heap,[CompressDelta(nodes_dict[id1],nodes_dict[new_id]),id1,new_id])
-            if nodes_dict[id2].child_h > 0:
-                heapq.heappush(cmp_heap,[CompressDelta(nodes_dict[id2],nodes_dict[new_id]),id2,new_id])
-            unmerged_count -= 1
-
-            for ID in self.adj_table[new_id]:
-                if not nodes_dict[ID].merged:
-                    n1 = nodes_dict[ID]
-                    n2 = nodes_dict[new_id]
-                    cut_v = cut_volume(self.adj_matrix,np.array(n1.partition), np.array(n2.partition))
-
+        profiler = self.profiler
+        profiler.count("k_tree_calls")
+        blocks = set(nodes_ids) # the leaves of this build: vertices or, for root_down, whole subtrees
+        with profiler.phase("k_tree.init"):
+            # Community-level cut weights between unmerged nodes, which are also the
+            # adjacency of this build; merges sum the rows
+            if com_adj is None:
+                com_adj = self.node_cuts(nodes_dict)
+            for i in nodes_ids:
+                for j, cut_v in com_adj[i].items():
+                    if j > i:
+                        diff = CombineDelta(nodes_dict[i], nodes_dict[j], cut_v, g_vol)
+                        min_heap.append((diff, i, j, cut_v))
+            min_heap = LazyHeap(lambda e: not (nodes_dict[e[1]].merged or nodes_dict[e[2]].merged), min_heap,
+                                compact_ratio=self.compact_ratio)
+        unmerged_count = n_start = len(nodes_ids)
+        with profiler.phase("k_tree.merge"):
+            while unmerged_count > 1:
+                entry = min_heap.pop()
+                if entry is None:
+                    break
+                diff, id1, id2, cut_v = entry
+                nodes_dict[id1].merged = True
+                nodes_dict[id2].merged = True
+                # Every other heap entry of id1 / id2 is now stale
+                min_heap.invalidate(len(com_adj[id1]) + len(com_adj[id2]) - 2)
+                new_id = next(self.id_g)
+                merge(new_id, id1, id2, cut_v, nodes_dict)
+                #compress delta
+                if nodes_dict[id1].child_h > 0:
+                    cmp_heap.append((CompressDelta(nodes_dict[id1],nodes_dict[new_id]),id1,new_id))
+                if nodes_dict[id2].child_h > 0:
+                    cmp_heap.append((CompressDelta(nodes_dict[id2],nodes_dict[new_id]),id2,new_id))
+                unmerged_count -= 1
+
+                new_cut = com_adj.pop(id1)
+                for nid, c in com_adj.pop(id2).items():
+                    new_cut[nid] = new_cut.get(nid, 0.0) + c
+                new_cut.pop(id1, None)
+                new_cut.pop(id2, None)
+                for nid, c in new_cut.items():
+                    nid_cut = com_adj[nid]
+                    nid_cut.pop(id1, None)
+                    nid_cut.pop(id2, None)
+                    nid_cut[new_id] = c
+                com_adj[new_id] = new_cut
+
+                # com_adj only holds unmerged nodes, so new_cut lists exactly the new candidates
+                for ID, cut_v in new_cut.items():
                     new_diff = CombineDelta(nodes_dict[ID], nodes_dict[new_id], cut_v, g_vol)
-                    heapq.heappush(min_heap, (new_diff, ID, new_id, cut_v))
+                    min_heap.push((new_diff, ID, new_id, cut_v))
+        self.heap_stats.append(min_heap.stats())
+        profiler.add_heap(self.heap_stats[-1])
+        profiler.count("merges", n_start - unmerged_count)
         root = new_id
 
         if unmerged_count > 1:
@@ -264,7 +367,7 @@ class PartitionTree():
             new_child_h = max([nodes_dict[i].child_h for i in unmerged_nodes]) + 1
 
             new_id = next(self.id_g)
-            new_node = PartitionTreeNode(ID=new_id,partition=list(nodes_ids),children=unmerged_nodes,
+            new_node = PartitionTreeNode(ID=new_id,partition=None,children=unmerged_nodes,
                                          vol=g_vol,g = 0,child_h=new_child_h)
             nodes_dict[new_id] = new_node
 
@@ -272,34 +375,63 @@ class PartitionTree():
                 nodes_dict[i].merged = True
                 nodes_dict[i].parent = new_id
                 if nodes_dict[i].child_h > 0:
-                    heapq.heappush(cmp_heap, [CompressDelta(nodes_dict[i], nodes_dict[new_id]), i, new_id])
+                    cmp_heap.append((CompressDelta(nodes_dict[i], nodes_dict[new_id]), i, new_id))
             root = new_id
 
-        if k is not None:
-            while nodes_dict[root].child_h > k:
-                diff, node_id, p_id = heapq.heappop(cmp_heap)
-                if child_tree_deepth(nodes_dict, node_id) <= k:
-                    continue
-                children = nodes_dict[node_id].children
-                compressNode(nodes_dict, node_id, p_id)
-                if nodes_dict[root].child_h == k:
-                    break
-                for e in cmp_heap:
-                    if e[1] == p_id:
-                        if child_tree_deepth(nodes_dict, p_id) > k:
-                            e[0] = CompressDelta(nodes_dict[e[1]], nodes_dict[e[2]])
-                    if e[1] in children:
-                        if nodes_dict[e[1]].child_h == 0:
-                            continue
-                        if child_tree_deepth(nodes_dict, e[1]) > k:
-                            e[2] = p_id
-                            e[0] = CompressDelta(nodes_dict[e[1]], nodes_dict[p_id])
-                heapq.heapify(cmp_heap)
+        if k is not None and nodes_dict[root].child_h > k:
+            with profiler.phase("k_tree.compress"):
+                depth = TreeDepths(nodes_dict, root, blocks)
+                # Indexed by node id: each node has at most one live (delta, id, parent) entry
+                cmp_entry = {e[1]: e for e in cmp_heap}
+                cmp_heap = LazyHeap(lambda e: cmp_entry.get(e[1]) is e, cmp_heap,
+                                    compact_ratio=self.compact_ratio)
+                while nodes_dict[root].child_h > k:
+                    diff, node_id, p_id = cmp_heap.pop()
+                    del cmp_entry[node_id]
+                    profiler.count("compress_pops")
+                    if depth(node_id) <= k:
+                        continue
+                    children = nodes_dict[node_id].children
+                    compressNode(nodes_dict, node_id, p_id)
+                    depth.compress(node_id)
+                    profiler.count("compressions")
+                    if nodes_dict[root].child_h == k:
+                        break
+                    # Only p_id (its child_cut grew) and the moved children (new parent) change delta;
+                    # a depth that reached k never grows back, so those entries are just left to expire
+                    updates = []
+                    if p_id in cmp_entry and depth(p_id) > k:
+                        pp_id = cmp_entry[p_id][2]
+                        updates.append((CompressDelta(nodes_dict[p_id], nodes_dict[pp_id]), p_id, pp_id))
+                    for c in children:
+                        if c in cmp_entry and nodes_dict[c].child_h > 0 and depth(c) > k:
+                            updates.append((CompressDelta(nodes_dict[c], nodes_dict[p_id]), c, p_id))
+                    for e in updates:
+                        cmp_entry[e[1]] = e
+                        cmp_heap.push(e)
+                    cmp_heap.invalidate(len(updates))
+                    profiler.count("compress_updates", len(updates))
+                profiler.add_heap(cmp_heap.stats(), prefix="cmp_heap")
+        if root is not None:
+            self.assign_partitions(nodes_dict, root, blocks)
         return root
 
+    def assign_partitions(self, node_dict, root_id, blocks=()):
+        """
+        Set the partition of every internal node under root_id to a zero-copy slice of
+        one leaf order (see leaf_ranges); blocks and childless nodes keep their own.
+        The order is read-only, since every ancestor's partition views the same memory.
+        """
+        order, ranges = leaf_ranges([root_id], lambda i: None if i in blocks else node_dict[i].children,
+                                    lambda i: node_dict[i].partition)
+        order.setflags(write=False)
+        for i, (start, end) in ranges.items():
+            if i not in blocks and node_dict[i].children:
+                node_dict[i].partition = order[start:end]
+
 
     def check_balance(self,node_dict,root_id):
-        root_c = copy.deepcopy(node_dict[root_id].children)
+        root_c = list(node_dict[root_id].children)
         for c in root_c:
             if node_dict[c].child_h == 0:
                 self.single_up(node_dict,c)
@@ -314,15 +446,13 @@ class PartitionTree():
         node_dict[p_id].children.add(new_id)
         node_dict[new_id] = grow_node
         node_dict[new_id].child_h = node_dict[node_id].child_h + 1
-        self.adj_table[new_id] = self.adj_table[node_id]
-        for i in self.adj_table[node_id].copy():
-            self.adj_table[i].add(new_id)
 
 
 
     def root_down_delta(self):
         if len(self.tree_node[self.root_id].children) < 3:
             return 0 , None , None
+        self.profiler.count("root_down_subproblems")
         subgraph_node_dict, ori_entropy = self.build_root_down()
         g_vol = self.tree_node[self.root_id].vol
         new_root = self.__build_k_tree(g_vol=g_vol,nodes_dict=subgraph_node_dict,k=2)
@@ -365,29 +495,78 @@ class PartitionTree():
             p = self.tree_node[l].parent
             h1_id.add(p)
         delta = 0
+        sub_ids = []
         for node_id in h1_id:
-            candidate_node = self.tree_node[node_id]
-            sub_nodes = candidate_node.partition
-            if len(sub_nodes) == 1:
-                id_mapping[node_id] = None
-            if len(sub_nodes) == 2:
-                id_mapping[node_id] = None
-            if len(sub_nodes) >= 3:
-                sub_g_vol = candidate_node.vol - candidate_node.g
-                subgraph_node_dict,ori_ent = self.build_sub_leaves(sub_nodes,candidate_node.vol)
-                sub_root = self.__build_k_tree(g_vol=sub_g_vol,nodes_dict=subgraph_node_dict,k = 2)
-                self.check_balance(subgraph_node_dict,sub_root)
-                new_ent = self.leaf_up_entropy(subgraph_node_dict,sub_root,node_id)
-                delta += (ori_ent - new_ent)
-                h1_new_child_tree[node_id] = subgraph_node_dict
-                id_mapping[node_id] = sub_root
+            id_mapping[node_id] = None
+            if len(self.tree_node[node_id].partition) >= 3:
+                sub_ids.append(node_id)
+        self.profiler.count("leaf_up_subproblems", len(sub_ids))
+        for node_id, (subgraph_node_dict, sub_root, sub_delta) in zip(sub_ids, self.leaf_up_subtrees(sub_ids)):
+            delta += sub_delta
+            h1_new_child_tree[node_id] = subgraph_node_dict
+            id_mapping[node_id] = sub_root
         delta = delta / self.g_num_nodes
         return delta,id_mapping,h1_new_child_tree
 
+    def leaf_up_subtree(self, node_id, base):
+        """
+        Rebuild the children of h1 node node_id as a height-2 subtree over its leaves,
+        numbering new nodes from base. Returns (sub_node_dict, sub_root, delta, ids used).
+        """
+        candidate_node = self.tree_node[node_id]
+        self.id_g = get_id(base)
+        sub_g_vol = candidate_node.vol - candidate_node.g
+        subgraph_node_dict,ori_ent,com_adj = self.build_sub_leaves(candidate_node.partition,candidate_node.vol)
+        sub_root = self.__build_k_tree(g_vol=sub_g_vol,nodes_dict=subgraph_node_dict,k = 2,com_adj = com_adj)
+        self.check_balance(subgraph_node_dict,sub_root)
+        new_ent = self.leaf_up_entropy(subgraph_node_dict,sub_root,node_id)
+        return subgraph_node_dict, sub_root, ori_ent - new_ent, next(self.id_g) - base
+
+    def leaf_up_subtrees(self, node_ids):
+        """
+        leaf_up_subtree for every h1 node in node_ids, on self.workers forked processes.
+
+        The subproblems are independent, so each numbers its new nodes from the same base
+        and the id blocks are laid out afterwards in node_ids order: the tree is the
+        same for any worker count or completion order.
+        """
+        base = next(self.id_g)
+        if self.workers == 1 or len(node_ids) < 2 or "fork" not in mp.get_all_start_methods():
+            results = [self.leaf_up_subtree(node_id, base) for node_id in node_ids]
+        else:
+            global _LEAF_UP_TREE
+            # Largest communities first so no worker is left alone with a big one at the end
+            order = sorted(range(len(node_ids)), key=lambda t: -len(self.tree_node[node_ids[t]].partition))
+            results, heap_stats, profilers = [None] * len(node_ids), [None] * len(node_ids), []
+            _LEAF_UP_TREE = self
+            try:
+                with ProcessPoolExecutor(self.workers, mp_context=mp.get_context("fork")) as pool:
+                    done = pool.map(_leaf_up_task, [(node_ids[t], base) for t in order])
+                    for t, (result, stats, profiler) in zip(order, done):
+                        results[t], heap_stats[t] = result, stats
+                        profilers.append(profiler)
+            finally:
+                _LEAF_UP_TREE = None
+            for stats in heap_stats:
+                self.heap_stats.extend(stats)
+            for profiler in profilers:
+                if profiler is not None:
+                    self.profiler.merge(profiler)
+
+        next_id = base
+        for t, (subgraph_node_dict, sub_root, sub_delta, used) in enumerate(results):
+            if next_id != base:
+                subgraph_node_dict = shift_ids(subgraph_node_dict, base, next_id - base)
+                sub_root += next_id - base
+            results[t] = (subgraph_node_dict, sub_root, sub_delta)
+            next_id += used
+        self.id_g = get_id(next_id)
+        return results
+
     def leaf_up_update(self,id_mapping,leaf_up_dict):
         for node_id,h1_root in id_mapping.items():
             if h1_root is None:
-                children = copy.deepcopy(self.tree_node[node_id].children)
+                children = list(self.tree_node[node_id].children)
                 for i in children:
                     self.single_up(self.tree_node,i)
             else:
@@ -413,10 +592,13 @@ class PartitionTree():
     def build_encoding_tree(self, k=2, mode='v2'):
         if k == 1:
             return
+        profiler = self.profiler
         if mode == 'v1' or k is None:
-            self.root_id = self.__build_k_tree(self.VOL, self.tree_node, k = k)
+            with profiler.phase("build_k_tree"):
+                self.root_id = self.__build_k_tree(self.VOL, self.tree_node, k = k)
         elif mode == 'v2':
-            self.root_id = self.__build_k_tree(self.VOL, self.tree_node, k = 2)
+            with profiler.phase("build_k_tree"):
+                self.root_id = self.__build_k_tree(self.VOL, self.tree_node, k = 2)
             self.check_balance(self.tree_node,self.root_id)
 
             if self.tree_node[self.root_id].child_h < 2:
@@ -426,13 +608,17 @@ class PartitionTree():
             flag = 0
             while self.tree_node[self.root_id].child_h < k:
                 if flag == 0:
-                    leaf_up_delta,id_mapping,leaf_up_dict = self.leaf_up()
-                    root_down_delta, new_id , root_down_dict = self.root_down_delta()
+                    with profiler.phase("leaf_up"):
+                        leaf_up_delta,id_mapping,leaf_up_dict = self.leaf_up()
+                    with profiler.phase("root_down"):
+                        root_down_delta, new_id , root_down_dict = self.root_down_delta()
 
                 elif flag == 1:
-                    leaf_up_delta, id_mapping, leaf_up_dict = self.leaf_up()
+                    with profiler.phase("leaf_up"):
+                        leaf_up_delta, id_mapping, leaf_up_dict = self.leaf_up()
                 elif flag == 2:
-                    root_down_delta, new_id , root_down_dict = self.root_down_delta()
+                    with profiler.phase("root_down"):
+                        root_down_delta, new_id , root_down_dict = self.root_down_delta()
                 else:
                     raise ValueError
 
@@ -440,12 +626,14 @@ class PartitionTree():
                     # print('root down')
                     # root down update and recompute root down delta
                     flag = 2
+                    profiler.count("root_down_levels")
                     self.root_down_update(new_id,root_down_dict)
 
                 else:
                     # leaf up update
                     # print('leave up')
                     flag = 1
+                    profiler.count("leaf_up_levels")
                     # print(self.tree_node[self.root_id].child_h)
                     self.leaf_up_update(id_mapping,leaf_up_dict)
                     # print(self.tree_node[self.root_id].child_h)
@@ -456,6 +644,8 @@ class PartitionTree():
                         for root_down_id, root_down_node in root_down_dict.items():
                             if root_down_node.child_h == 0:
                                 root_down_node.children = self.tree_node[root_down_id].children
+            # Spliced-in subtrees still slice their own subproblem's order; move them all onto one
+            self.assign_partitions(self.tree_node, self.root_id)
         count = 0
         for _ in LayerFirst(self.tree_node, self.root_id):
             count += 1
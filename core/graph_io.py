@@ -0,0 +1,227 @@
+import itertools
+import json
+import os
+import zipfile
+import numba as nb
+import numpy as np
+import scipy.sparse as sp
+
+# On-disk CSR graph: a directory holding indptr.npy, indices.npy, data.npy and
+# meta.json. The arrays are plain .npy files, so load_csr can memory-map them.
+CSR_FORMAT = "si-csr"
+CSR_VERSION = 1
+
+
+def _index_dtype(num_nodes, nnz):
+    """int32 whenever it fits, as scipy would pick, so loading never has to downcast (copy) the arrays."""
+    return np.int32 if max(num_nodes, nnz) < np.iinfo(np.int32).max else np.int64
+
+
+def text_edge_chunks(path, delimiter=None, chunk_size=1_000_000):
+    """
+    Stream an edge list text file (CSV / TSV / whitespace separated, '#' comments)
+    as float64 arrays of shape (<= chunk_size, 2 or 3): u, v[, weight]. Node ids
+    must be integers; a non-numeric first line is skipped as a header.
+    """
+    if delimiter is None and path.endswith(".csv"):
+        delimiter = ","
+    elif delimiter is None and path.endswith(".tsv"):
+        delimiter = "\t"
+    with open(path) as f:
+        first = True
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                break
+            if first:
+                first = False
+                head = lines[0].strip().split(delimiter)[0] if lines[0].strip() else ""
+                try:
+                    float(head)
+                except ValueError:
+                    lines = lines[1:]
+            if lines:
+                chunk = np.loadtxt(lines, delimiter=delimiter, comments="#", ndmin=2, dtype=np.float64)
+                if len(chunk):
+                    yield chunk
+
+
+def npz_edge_chunks(path, chunk_size=1_000_000):
+    """
+    Stream the `edges` array ((E, 2) or (E, 3)) of an .npz file in chunks. Rows are
+    read straight from the (possibly compressed) zip member, so the array is never
+    held in memory; only a Fortran-ordered array has to be loaded whole.
+    """
+    with zipfile.ZipFile(path) as zf, zf.open("edges.npy") as f:
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(f)
+        if len(shape) != 2:
+            raise ValueError(f"edges must have shape (E, 2) or (E, 3), got {shape}")
+        if fortran_order:
+            with np.load(path) as npz:
+                edges = npz["edges"]
+            for start in range(0, len(edges), chunk_size):
+                yield edges[start:start + chunk_size]
+            return
+        row_bytes = dtype.itemsize * shape[1]
+        for start in range(0, shape[0], chunk_size):
+            rows = min(chunk_size, shape[0] - start)
+            yield np.frombuffer(f.read(rows * row_bytes), dtype=dtype).reshape(rows, shape[1])
+
+
+@nb.jit(nopython=True)
+def _canonicalize_rows(indptr, indices, data, out_indptr):
+    """
+    Sort every row by column, sum duplicate columns and drop zero weights,
+    compacting the rows to the front of indices / data in place.
+    out_indptr receives the new row offsets; returns the final nnz.
+    """
+    n = len(indptr) - 1
+    write = 0
+    out_indptr[0] = 0
+    for i in range(n):
+        start, end = indptr[i], indptr[i + 1]
+        row_start = write
+        if end > start:
+            cols = indices[start:end].copy()
+            vals = data[start:end].copy()
+            order = np.argsort(cols, kind='mergesort')
+            prev = -1
+            for k in order:
+                if cols[k] == prev:
+                    data[write - 1] += vals[k]
+                else:
+                    indices[write] = cols[k]
+                    data[write] = vals[k]
+                    prev = cols[k]
+                    write += 1
+            keep = row_start
+            for p in range(row_start, write):
+                if data[p] != 0:
+                    indices[keep] = indices[p]
+                    data[keep] = data[p]
+                    keep += 1
+            write = keep
+        out_indptr[i + 1] = write
+    return write
+
+
+def write_csr_from_edges(chunks, path, num_nodes=None):
+    """
+    Build an on-disk symmetric CSR graph from an iterable of edge chunks in two
+    streaming passes (degree count, then scatter into memory-mapped arrays).
+    `chunks` must be re-iterable (e.g. a list or a callable returning a fresh iterator).
+    Edges are undirected; duplicates are summed and a self-loop (u, u, w) is stored
+    once as A[u, u] = w, as edges_to_csr does. Returns the path.
+    """
+    chunk_iter = chunks if callable(chunks) else (lambda: iter(chunks))
+    os.makedirs(path, exist_ok=True)
+
+    # Pass 1: entries per row
+    counts = np.zeros(num_nodes or 0, dtype=np.int64)
+    for chunk in chunk_iter():
+        u, v = chunk[:, 0].astype(np.int64), chunk[:, 1].astype(np.int64)
+        rows = np.concatenate([u, v[u != v]])
+        if len(rows) and rows.max() >= len(counts):
+            if num_nodes is not None:
+                raise ValueError(f"node id {rows.max()} out of range for num_nodes={num_nodes}")
+            counts = np.concatenate([counts, np.zeros(rows.max() + 1 - len(counts), dtype=np.int64)])
+        ids, n_ids = np.unique(rows, return_counts=True)
+        counts[ids] += n_ids
+    n = len(counts)
+    total = int(counts.sum())
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+
+    # Pass 2: scatter every entry to its row slot
+    tmp_indices = np.lib.format.open_memmap(os.path.join(path, "indices.tmp.npy"), mode="w+",
+                                            dtype=np.int64, shape=(total,))
+    tmp_data = np.lib.format.open_memmap(os.path.join(path, "data.tmp.npy"), mode="w+",
+                                         dtype=np.float64, shape=(total,))
+    cursor = indptr[:-1].copy()
+    for chunk in chunk_iter():
+        u, v = chunk[:, 0].astype(np.int64), chunk[:, 1].astype(np.int64)
+        w = chunk[:, 2].astype(np.float64) if chunk.shape[1] > 2 else np.ones(len(u))
+        off = u != v
+        rows = np.concatenate([u, v[off]])
+        cols = np.concatenate([v, u[off]])
+        vals = np.concatenate([w, w[off]])
+        order = np.argsort(rows, kind="stable")
+        rows, cols, vals = rows[order], cols[order], vals[order]
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows, side="left")
+        pos = cursor[rows] + rank
+        tmp_indices[pos] = cols
+        tmp_data[pos] = vals
+        ids, n_ids = np.unique(rows, return_counts=True)
+        cursor[ids] += n_ids
+
+    final_indptr = np.zeros(n + 1, dtype=np.int64)
+    nnz = _canonicalize_rows(indptr, tmp_indices, tmp_data, final_indptr)
+
+    index_dtype = _index_dtype(n, nnz)
+    out = np.lib.format.open_memmap(os.path.join(path, "indptr.npy"), mode="w+", dtype=index_dtype, shape=(n + 1,))
+    out[:] = final_indptr
+    out.flush()
+    for name, src, dtype in (("indices", tmp_indices, index_dtype), ("data", tmp_data, np.float64)):
+        out = np.lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode="w+", dtype=dtype, shape=(nnz,))
+        for start in range(0, nnz, 1 << 24):
+            stop = min(start + (1 << 24), nnz)
+            out[start:stop] = src[start:stop]
+        out.flush()
+        del out
+    del tmp_indices, tmp_data
+    os.remove(os.path.join(path, "indices.tmp.npy"))
+    os.remove(os.path.join(path, "data.tmp.npy"))
+
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"format": CSR_FORMAT, "version": CSR_VERSION, "num_nodes": n, "nnz": int(nnz)}, f)
+    return path
+
+
+def write_csr(csr, path):
+    """Store a (symmetric) scipy.sparse adjacency in the on-disk CSR format."""
+    csr = sp.csr_matrix(csr, dtype=np.float64)
+    csr.sum_duplicates()
+    csr.eliminate_zeros()
+    csr.sort_indices()
+    os.makedirs(path, exist_ok=True)
+    index_dtype = _index_dtype(csr.shape[0], csr.nnz)
+    np.save(os.path.join(path, "indptr.npy"), csr.indptr.astype(index_dtype))
+    np.save(os.path.join(path, "indices.npy"), csr.indices.astype(index_dtype))
+    np.save(os.path.join(path, "data.npy"), csr.data)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"format": CSR_FORMAT, "version": CSR_VERSION, "num_nodes": csr.shape[0], "nnz": int(csr.nnz)}, f)
+    return path
+
+
+def ingest(src, path, delimiter=None, num_nodes=None, chunk_size=1_000_000):
+    """
+    Convert an edge list (.csv / .tsv / .txt), an .npz holding an `edges` array, or a
+    scipy.sparse .npz adjacency (sp.save_npz) into the on-disk CSR format at `path`.
+    """
+    if src.endswith(".npz"):
+        with np.load(src) as npz:
+            is_sparse = "format" in npz.files
+        if is_sparse:
+            return write_csr(sp.load_npz(src), path)
+        return write_csr_from_edges(lambda: npz_edge_chunks(src, chunk_size), path, num_nodes)
+    return write_csr_from_edges(lambda: text_edge_chunks(src, delimiter, chunk_size), path, num_nodes)
+
+
+def load_csr(path, mmap=True):
+    """
+    Open an on-disk CSR graph as a scipy CSR matrix. With mmap=True the arrays stay
+    memory-mapped (read-only), so loading is O(1) and pages are read on demand.
+    as_csr, PartitionTree, GreedySIOptimizer and SILouvainOptimizer accept the result directly.
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("format") != CSR_FORMAT:
+        raise ValueError(f"{path} is not an {CSR_FORMAT} graph")
+    mode = "r" if mmap else None
+    indptr = np.load(os.path.join(path, "indptr.npy"), mmap_mode=mode)
+    indices = np.load(os.path.join(path, "indices.npy"), mmap_mode=mode)
+    data = np.load(os.path.join(path, "data.npy"), mmap_mode=mode)
+    n = meta["num_nodes"]
+    return sp.csr_matrix((data, indices, indptr), shape=(n, n))
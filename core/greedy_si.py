@@ -1,19 +1,10 @@
 import math
-import heapq
 import numpy as np
-import numba as nb
 from collections import defaultdict
-
-@nb.jit(nopython=True)
-def calculate_cut_weight(adj_matrix, p1, p2):
-    """Numba-accelerated cut calculation for greedy merging."""
-    cut_w = 0.0
-    for i in range(len(p1)):
-        for j in range(len(p2)):
-            w = adj_matrix[p1[i], p2[j]]
-            if w != 0:
-                cut_w += w
-    return cut_w
+from core.lazy_heap import LazyHeap
+from core.leaf_order import leaf_ranges
+from core.profiling import make_profiler
+from core.sparse_graph import as_csr
 
 def compute_entropy_delta(g1, g2, v1, v2, dl1, dl2, cut_12, vol_total):
     """
@@ -37,102 +28,125 @@ def compute_entropy_delta(g1, g2, v1, v2, dl1, dl2, cut_12, vol_total):
 class GreedySIOptimizer:
     """
     Optimized Greedy Structural Entropy minimization.
+    G may be a NetworkX graph, a scipy.sparse / dense adjacency or an edge list
+    (see as_csr); the graph is held as CSR so initialization is O(E).
+    profile=True (or a core.profiling.Profiler) records merge / heap counters and
+    phase times in self.stats.
     """
-    def __init__(self, G):
+    def __init__(self, G, compact_ratio=0.5, profile=False):
         self.G = G
-        self.adj = nx.to_numpy_array(G)
-        self.N = len(G.nodes())
-        self.vol_total = np.sum(self.adj)
+        self.compact_ratio = compact_ratio # stale-entry share that triggers a heap rebuild
+        self.heap_stats = None
+        self.profiler = make_profiler(profile)
+        self.stats = self.profiler if self.profiler.enabled else None
+        self.adj = as_csr(G)
+        self.N = self.adj.shape[0]
+        self.vol_total = self.adj.sum()
         
         # Initial communities (singletons)
+        degrees = np.asarray(self.adj.sum(axis=1)).ravel()
+        self_loops = self.adj.diagonal()
         self.partition = {i: i for i in range(self.N)}
         self.com_info = {}
-        for i in range(self.N):
-            degree = np.sum(self.adj[i])
-            self_loop = self.adj[i, i]
+        for i, (degree, self_loop) in enumerate(zip(degrees.tolist(), self_loops.tolist())):
             g = degree - self_loop # initial g
             dl = degree * math.log2(degree) if degree > 0 else 0
-            self.com_info[i] = {'partition': [i], 'vol': degree, 'g': g, 'dl': dl}
+            self.com_info[i] = {'vol': degree, 'g': g, 'dl': dl}
+
+    def _edges(self):
+        """Upper-triangle (i < j) positive edges of the adjacency as parallel lists."""
+        coo = self.adj.tocoo()
+        mask = (coo.col > coo.row) & (coo.data > 0)
+        return coo.row[mask].tolist(), coo.col[mask].tolist(), coo.data[mask].tolist()
 
     def run(self, target_communities=None):
+        profiler = self.profiler
         active_ids = set(self.com_info.keys())
-        
-        # Build initial merge heap
-        pq = []
-        for i in range(self.N):
-            for j in range(i + 1, self.N):
-                if self.adj[i, j] > 0:
-                    delta = compute_entropy_delta(
-                        self.com_info[i]['g'], self.com_info[j]['g'],
-                        self.com_info[i]['vol'], self.com_info[j]['vol'],
-                        self.com_info[i]['dl'], self.com_info[j]['dl'],
-                        self.adj[i, j], self.vol_total
-                    )
-                    heapq.heappush(pq, (delta, i, j, self.adj[i, j]))
+        with profiler.phase("greedy.init"):
+            rows, cols, weights = self._edges()
 
-        # Track community edges to speed up merges
-        com_adj = defaultdict(lambda: defaultdict(float))
-        for i in range(self.N):
-            for j in range(i + 1, self.N):
-                if self.adj[i, j] > 0:
-                    com_adj[i][j] = self.adj[i, j]
-                    com_adj[j][i] = self.adj[i, j]
+            # Build initial merge heap from the edge list only
+            pq = []
+            for i, j, w in zip(rows, cols, weights):
+                delta = compute_entropy_delta(
+                    self.com_info[i]['g'], self.com_info[j]['g'],
+                    self.com_info[i]['vol'], self.com_info[j]['vol'],
+                    self.com_info[i]['dl'], self.com_info[j]['dl'],
+                    w, self.vol_total
+                )
+                pq.append((delta, i, j, w))
+            pq = LazyHeap(lambda e: e[1] in active_ids and e[2] in active_ids, pq,
+                          compact_ratio=self.compact_ratio)
 
-        next_id = self.N
-        while len(active_ids) > (target_communities if target_communities else 1):
-            if not pq: break
-            
-            delta, id1, id2, cut_w = heapq.heappop(pq)
-            if id1 not in active_ids or id2 not in active_ids: continue
+            # Track community edges to speed up merges
+            com_adj = defaultdict(lambda: defaultdict(float))
+            for i, j, w in zip(rows, cols, weights):
+                com_adj[i][j] = w
+                com_adj[j][i] = w
+
+        with profiler.phase("greedy.merge"):
+            next_id = self.N
+            while len(active_ids) > (target_communities if target_communities else 1):
+                entry = pq.pop()
+                if entry is None: break
+                delta, id1, id2, cut_w = entry
             
-            # Merge id1 and id2 into new_id
-            new_id = next_id
-            next_id += 1
+                # Merge id1 and id2 into new_id
+                new_id = next_id
+                next_id += 1
             
-            info1, info2 = self.com_info[id1], self.com_info[id2]
-            new_vol = info1['vol'] + info2['vol']
-            new_g = info1['g'] + info2['g'] - 2 * cut_w
-            new_dl = info1['dl'] + info2['dl']
-            new_part = info1['partition'] + info2['partition']
+                info1, info2 = self.com_info[id1], self.com_info[id2]
+                new_vol = info1['vol'] + info2['vol']
+                new_g = info1['g'] + info2['g'] - 2 * cut_w
+                new_dl = info1['dl'] + info2['dl']
             
-            self.com_info[new_id] = {'partition': new_part, 'vol': new_vol, 'g': new_g, 'dl': new_dl}
+                # Members are only laid out once at the end (see leaf_ranges)
+                self.com_info[new_id] = {'children': (id1, id2), 'vol': new_vol, 'g': new_g, 'dl': new_dl}
             
-            active_ids.remove(id1)
-            active_ids.remove(id2)
+                active_ids.remove(id1)
+                active_ids.remove(id2)
+                # Every other heap entry of id1 / id2 is now stale
+                pq.invalidate(len(com_adj[id1]) + len(com_adj[id2]) - 2)
             
-            # Update community adjacency
-            new_neighbors = {}
-            for nid, w in com_adj[id1].items():
-                if nid != id2 and nid in active_ids:
-                    new_neighbors[nid] = new_neighbors.get(nid, 0) + w
-            for nid, w in com_adj[id2].items():
-                if nid != id1 and nid in active_ids:
-                    new_neighbors[nid] = new_neighbors.get(nid, 0) + w
+                # Update community adjacency
+                new_neighbors = {}
+                for nid, w in com_adj[id1].items():
+                    if nid != id2 and nid in active_ids:
+                        new_neighbors[nid] = new_neighbors.get(nid, 0) + w
+                for nid, w in com_adj[id2].items():
+                    if nid != id1 and nid in active_ids:
+                        new_neighbors[nid] = new_neighbors.get(nid, 0) + w
             
-            # Clean up old
-            del com_adj[id1]
-            del com_adj[id2]
-            for nid in list(new_neighbors.keys()):
-                com_adj[nid].pop(id1, None)
-                com_adj[nid].pop(id2, None)
-                com_adj[nid][new_id] = new_neighbors[nid]
-                com_adj[new_id][nid] = new_neighbors[nid]
+                # Clean up old
+                del com_adj[id1]
+                del com_adj[id2]
+                for nid in list(new_neighbors.keys()):
+                    com_adj[nid].pop(id1, None)
+                    com_adj[nid].pop(id2, None)
+                    com_adj[nid][new_id] = new_neighbors[nid]
+                    com_adj[new_id][nid] = new_neighbors[nid]
                 
-                # Push new deltas
-                d = compute_entropy_delta(
-                    new_g, self.com_info[nid]['g'],
-                    new_vol, self.com_info[nid]['vol'],
-                    new_dl, self.com_info[nid]['dl'],
-                    new_neighbors[nid], self.vol_total
-                )
-                heapq.heappush(pq, (d, new_id, nid, new_neighbors[nid]))
+                    # Push new deltas
+                    d = compute_entropy_delta(
+                        new_g, self.com_info[nid]['g'],
+                        new_vol, self.com_info[nid]['vol'],
+                        new_dl, self.com_info[nid]['dl'],
+                        new_neighbors[nid], self.vol_total
+                    )
+                    pq.push((d, new_id, nid, new_neighbors[nid]))
             
-            active_ids.add(new_id)
+                active_ids.add(new_id)
+        self.heap_stats = pq.stats()
+        profiler.add_heap(self.heap_stats)
+        profiler.count("merges", next_id - self.N)
 
-        # Build final partition map
+        # Build final partition map; each community's 'partition' is a view of one leaf order
+        order, ranges = leaf_ranges(active_ids, lambda c: self.com_info[c].get('children'), lambda c: (c,))
         final_partition = {}
         for i, cid in enumerate(active_ids):
-            for node in self.com_info[cid]['partition']:
+            start, end = ranges[cid]
+            members = self.com_info[cid]['partition'] = order[start:end]
+            for node in members.tolist():
                 final_partition[node] = i
         return final_partition
 
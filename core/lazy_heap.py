@@ -0,0 +1,75 @@
+import heapq
+
+
+class LazyHeap:
+    """
+    Min-heap with lazy deletion and stale-entry compaction for greedy merge loops.
+
+    Entries go stale when one of their communities is merged away; `is_live(item)`
+    tells them apart. Callers report how many live entries a merge invalidated via
+    invalidate(n). Stale entries are skipped on pop, and the heap is rebuilt
+    without them once they make up more than `compact_ratio` of it
+    (compact_ratio=None keeps plain lazy deletion).
+    """
+    def __init__(self, is_live, items=None, compact_ratio=0.5, min_compact_size=1024, trace_every=1024):
+        self.is_live = is_live
+        self.heap = list(items) if items is not None else []
+        heapq.heapify(self.heap)
+        self.compact_ratio = compact_ratio
+        self.min_compact_size = min_compact_size
+        self.stale = 0
+
+        # Instrumentation
+        self.trace_every = trace_every
+        self.pushes = len(self.heap)
+        self.pops = 0
+        self.stale_pops = 0
+        self.compactions = 0
+        self.peak_size = len(self.heap)
+        self.size_trace = [(0, len(self.heap))] # (pops so far, heap size) samples
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, item):
+        heapq.heappush(self.heap, item)
+        self.pushes += 1
+        if len(self.heap) > self.peak_size:
+            self.peak_size = len(self.heap)
+
+    def pop(self):
+        """Pop the smallest live entry; None once only stale entries are left."""
+        while self.heap:
+            item = heapq.heappop(self.heap)
+            self.pops += 1
+            if self.trace_every and self.pops % self.trace_every == 0:
+                self.size_trace.append((self.pops, len(self.heap)))
+            if self.is_live(item):
+                return item
+            self.stale_pops += 1
+            if self.stale > 0:
+                self.stale -= 1
+        return None
+
+    def invalidate(self, n=1):
+        self.stale += n
+        if self.compact_ratio is not None and len(self.heap) >= self.min_compact_size \
+                and self.stale > self.compact_ratio * len(self.heap):
+            self.compact()
+
+    def compact(self):
+        self.heap = [item for item in self.heap if self.is_live(item)]
+        heapq.heapify(self.heap)
+        self.stale = 0
+        self.compactions += 1
+
+    def stats(self):
+        return {
+            "pushes": self.pushes,
+            "pops": self.pops,
+            "stale_pops": self.stale_pops,
+            "compactions": self.compactions,
+            "peak_size": self.peak_size,
+            "final_size": len(self.heap),
+            "size_trace": self.size_trace + [(self.pops, len(self.heap))],
+        }
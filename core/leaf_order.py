@@ -0,0 +1,37 @@
+import numpy as np
+
+
+def leaf_ranges(roots, children, leaf_items):
+    """
+    Lay the leaves of a merge forest out in one array so every subtree is a
+    contiguous [start, end) range of it.
+
+    Merges then only record their children (O(1)) instead of concatenating leaf
+    lists, and a single relabel pass in O(number of nodes + leaves) gives every
+    node its partition as a zero-copy slice order[start:end].
+
+    roots: ids of the forest roots; children(i): child ids of i, or None / empty
+    for a leaf block; leaf_items(i): the items (vertices) held by leaf block i.
+    Returns (order, ranges) with order an int64 array of all leaf items in
+    depth-first order and ranges {id: (start, end)} for every node reached.
+    """
+    items = []
+    ranges = {}
+    for root in roots:
+        stack = [(root, False)]
+        while stack:
+            node_id, done = stack.pop()
+            if done:
+                ranges[node_id] = (ranges[node_id], len(items))
+                continue
+            kids = children(node_id)
+            if not kids:
+                start = len(items)
+                items.extend(leaf_items(node_id))
+                ranges[node_id] = (start, len(items))
+                continue
+            ranges[node_id] = len(items)
+            stack.append((node_id, True))
+            # Reversed so the first child's leaves come first
+            stack.extend((c, False) for c in reversed(list(kids)))
+    return np.asarray(items, dtype=np.int64), ranges
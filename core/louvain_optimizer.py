@@ -1,22 +1,272 @@
+from core.profiling import NULL_PROFILER, make_profiler
 from core.si_base import StructuralEntropyBase
+from core.sparse_graph import adjacency_arrays, aggregate, aggregate_graph, as_csr
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import networkx as nx
 import math
+import os
+import numba as nb
+import numpy as np
+
+@nb.jit(nopython=True)
+def _community_h(v, g, dl, two_w):
+    if v <= 0: return 0.0
+    h = - (g / two_w) * math.log2(v / two_w)
+    h += (v / two_w) * math.log2(v)
+    h -= dl / two_w
+    return h
+
+@nb.jit(nopython=True)
+def _louvain_sweep(indptr, indices, data, order, labels, degree, dlog2d, V_C, g_C, dl_C, two_w):
+    """
+    One node-move sweep over `order` (same rule as SILouvainOptimizerPass._one_pass).
+    Mutates labels and the per-community V_C / g_C / dl_C arrays; returns the number of moves.
+    """
+    n = len(labels)
+    k_comm = np.zeros(n)
+    stamp = np.full(n, -1, dtype=np.int64)
+    cands = np.empty(n, dtype=np.int64)
+    moves = 0
+    for node in order:
+        own = labels[node]
+        # Weight from node to each neighbouring community, in first-seen order
+        n_cand = 0
+        k_tot = 0.0
+        for p in range(indptr[node], indptr[node + 1]):
+            c = labels[indices[p]]
+            if stamp[c] != node:
+                stamp[c] = node
+                k_comm[c] = 0.0
+                cands[n_cand] = c
+                n_cand += 1
+            if indices[p] != node:
+                k_comm[c] += data[p]
+                k_tot += data[p]
+        k_own = k_comm[own] if stamp[own] == node else 0.0
+
+        v_old_after = V_C[own] - degree[node]
+        dl_old_after = dl_C[own] - dlog2d[node]
+        g_old_after = g_C[own] + k_own - (k_tot - k_own)
+        h_old = _community_h(V_C[own], g_C[own], dl_C[own], two_w)
+        h_old_after = _community_h(v_old_after, g_old_after, dl_old_after, two_w)
+
+        best = own
+        min_delta = 1e-10 # Use a small epsilon for stability
+        best_g = 0.0
+        for q in range(n_cand):
+            c = cands[q]
+            if c == own: continue
+            g_new_after = g_C[c] - k_comm[c] + (k_tot - k_comm[c])
+            entropy_before = h_old + _community_h(V_C[c], g_C[c], dl_C[c], two_w)
+            entropy_after = h_old_after + _community_h(V_C[c] + degree[node], g_new_after,
+                                                       dl_C[c] + dlog2d[node], two_w)
+            delta = entropy_after - entropy_before
+            if delta < -min_delta:
+                min_delta = -delta
+                best = c
+                best_g = g_new_after
+
+        if best != own:
+            V_C[own] = v_old_after
+            dl_C[own] = dl_old_after
+            g_C[own] = g_old_after
+            V_C[best] += degree[node]
+            dl_C[best] += dlog2d[node]
+            g_C[best] = best_g
+            labels[node] = best
+            moves += 1
+    return moves
+
+def _node_terms(indptr, indices, data):
+    """Per-node degree, self-loop weight, d*log2(d) and 2W of a CSR graph, as StructuralEntropyBase defines them."""
+    n = len(indptr) - 1
+    rows = np.repeat(np.arange(n), np.diff(indptr))
+    loops = indices == rows
+
+    # Weighted degree counts self-loops twice, as in NetworkX
+    self_loop = np.bincount(rows[loops], weights=data[loops], minlength=n)
+    degree = np.bincount(rows, weights=data, minlength=n) + self_loop
+    W = sum(degree.tolist()) / 2
+    if W == 0:
+        W = (len(indices) + loops.sum()) / 2
+
+    # Isolated nodes get a unit volume, as in StructuralEntropyBase
+    init_degree = np.where(degree != 0, degree, 1.0)
+    dlog2d = np.array([d * math.log2(d) for d in init_degree.tolist()])
+    return degree, init_degree, self_loop, dlog2d, 2 * W
+
+def partition_entropy(indptr, indices, data, labels):
+    """2D structural entropy (StructuralEntropyBase.get_total_entropy) of integer labels on a CSR graph."""
+    labels = np.asarray(labels, dtype=np.int64)
+    _, init_degree, self_loop, dlog2d, two_w = _node_terms(indptr, indices, data)
+    rows = np.repeat(np.arange(len(labels)), np.diff(indptr))
+    internal = (labels[rows] == labels[indices]) & (rows != indices)
+    n_comms = int(labels.max()) + 1
+    V = np.bincount(labels, weights=init_degree, minlength=n_comms)
+    dl = np.bincount(labels, weights=dlog2d, minlength=n_comms)
+    g = np.bincount(labels, weights=init_degree - 2 * self_loop, minlength=n_comms) \
+        - np.bincount(labels[rows[internal]], weights=data[internal], minlength=n_comms)
+    h = 0.0
+    for c in np.flatnonzero(V > 0):
+        h += _community_h(V[c], g[c], dl[c], two_w)
+    return h
+
+class SILouvainArrayPass:
+    """
+    Array-based single-level Louvain pass over CSR arrays.
+    Keeps node and community state in NumPy arrays and runs the node-move
+    sweeps in a numba kernel. Communities are labelled by node index.
+    """
+    def __init__(self, indptr, indices, data):
+        self.indptr, self.indices, self.data = indptr, indices, data
+        self.degree, init_degree, self_loop, self.dlog2d, self.two_w = _node_terms(indptr, indices, data)
+        self.labels = np.arange(len(indptr) - 1, dtype=np.int64)
+        self.V_C = init_degree.copy()
+        self.g_C = init_degree - 2 * self_loop
+        self.dl_C = self.dlog2d.copy()
+
+    def optimize(self, order=None, profiler=NULL_PROFILER):
+        if order is None:
+            order = np.arange(len(self.labels), dtype=np.int64)
+        while True:
+            moves = _louvain_sweep(self.indptr, self.indices, self.data, order, self.labels, self.degree,
+                                   self.dlog2d, self.V_C, self.g_C, self.dl_C, self.two_w)
+            profiler.record("moves_per_pass", moves)
+            if moves == 0:
+                break
+        return self.labels
+
+def louvain_labels(indptr, indices, data, rng=None, profiler=NULL_PROFILER):
+    """
+    Multi-level SI Louvain on CSR arrays; returns community labels 0..C-1 per node.
+    rng: optional np.random.Generator used to shuffle the node order at every level.
+    profiler: core.profiling.Profiler receiving sweep moves, level sizes and phase times.
+    """
+    labels = np.arange(len(indptr) - 1, dtype=np.int64)
+    while True:
+        n = len(indptr) - 1
+        profiler.count("levels")
+        profiler.record("level_nodes", n)
+        order = rng.permutation(n) if rng is not None else None
+        with profiler.phase("louvain.move"):
+            level = SILouvainArrayPass(indptr, indices, data).optimize(order, profiler)
+        communities, level = np.unique(level, return_inverse=True)
+        if len(communities) == n:
+            break
+        labels = level[labels]
+        if len(communities) == 1:
+            break
+        with profiler.phase("louvain.aggregate"):
+            indptr, indices, data = aggregate(indptr, indices, data, level, len(communities))
+    return labels
+
+_shared_graph = None
+
+def _attach_shared_graph(specs):
+    """Process pool initializer: map the graph arrays published by _share_arrays."""
+    global _shared_graph
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    arrays = [np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+              for shm, (_, shape, dtype) in zip(blocks, specs)]
+    _shared_graph = (blocks, arrays)
+
+def _share_arrays(arrays):
+    blocks, specs = [], []
+    for arr in arrays:
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+        blocks.append(shm)
+        specs.append((shm.name, arr.shape, arr.dtype.str))
+    return blocks, specs
+
+def _monte_carlo_chunk(run_ids, seeds, arrays=None):
+    """Run the given seeded Louvain runs; return their entropies and the best run's labels."""
+    indptr, indices, data = arrays if arrays is not None else _shared_graph[1]
+    entropies = []
+    best_run, best_labels = None, None
+    for run_id, seed in zip(run_ids, seeds):
+        labels = louvain_labels(indptr, indices, data, np.random.default_rng(seed))
+        h = partition_entropy(indptr, indices, data, labels)
+        entropies.append(h)
+        if best_run is None or h < entropies[best_run - run_ids[0]]:
+            best_run, best_labels = run_id, labels
+    return run_ids, entropies, best_run, best_labels
+
+def _label_partition(nodes, labels):
+    """Map compact labels to a {node: representative node} partition, as the python engine returns."""
+    _, first = np.unique(labels, return_index=True)
+    return {node: nodes[first[c]] for node, c in zip(nodes, labels.tolist())}
 
 class SILouvainOptimizer(StructuralEntropyBase):
     """
     Louvain-style optimizer to minimize Structural Entropy.
     Iteratively moves nodes between communities to find the optimal structural partition.
+
+    graph may also be a scipy.sparse adjacency, e.g. a memory-mapped graph from
+    core.graph_io.load_csr. It is then kept as CSR (self.G is None), only the
+    numba engine runs, and self.partition is a label array indexed by node.
+
+    profile=True (or a core.profiling.Profiler) records levels, moves per pass and
+    phase times in self.stats.
     """
-    def run(self):
+    def __init__(self, graph, profile=False):
+        self.profiler = make_profiler(profile)
+        self.stats = self.profiler if self.profiler.enabled else None
+        if isinstance(graph, nx.Graph):
+            self.adj = None
+            super().__init__(graph)
+        else:
+            self.G = None
+            self.adj = as_csr(graph)
+            self.partition = np.arange(self.adj.shape[0], dtype=np.int64)
+
+    def _arrays(self):
+        """(nodes, indptr, indices, data) of the graph; nodes is None in CSR mode."""
+        if self.adj is not None:
+            return None, self.adj.indptr, self.adj.indices, self.adj.data
+        return adjacency_arrays(self.G)
+
+    def _set_labels(self, nodes, labels):
+        if nodes is None:
+            _, first = np.unique(labels, return_index=True)
+            self.partition = first[labels]
+        else:
+            self.set_partition(_label_partition(nodes, labels))
+
+    def get_total_entropy(self):
+        if self.adj is None:
+            return super().get_total_entropy()
+        return partition_entropy(self.adj.indptr, self.adj.indices, self.adj.data, self.partition)
+
+    def run(self, engine='numba', seed=None):
         """
         Multi-level Louvain optimization for Structural Entropy.
+        engine: 'numba' (default) runs every level on CSR arrays with SILouvainArrayPass,
+        'python' on NetworkX graphs with SILouvainOptimizerPass. Both make the same moves
+        and build the same level graphs, so they return the same partition.
+        seed: shuffle the node order at every level (numba engine only).
         """
+        if engine == 'numba':
+            nodes, indptr, indices, data = self._arrays()
+            rng = np.random.default_rng(seed) if seed is not None else None
+            self._set_labels(nodes, louvain_labels(indptr, indices, data, rng, self.profiler))
+            return self.partition
+        if engine != 'python':
+            raise ValueError(f"Unknown engine: {engine}")
+        if self.G is None:
+            raise ValueError("the python engine needs a NetworkX graph")
+
         current_graph = self.G
         partition_map = {node: node for node in current_graph.nodes()}
-        
+
         while True:
+            self.profiler.count("levels")
+            self.profiler.record("level_nodes", current_graph.number_of_nodes())
             optimizer = SILouvainOptimizerPass(current_graph)
-            new_partition = optimizer.optimize()
+            optimizer.profiler = self.profiler
+            with self.profiler.phase("louvain.move"):
+                new_partition = optimizer.optimize()
             
             # Update the global partition map
             nodes_moved = False
@@ -30,38 +280,86 @@ class SILouvainOptimizer(StructuralEntropyBase):
                 break
                 
             # Aggregate graph for next level
-            current_graph = self._aggregate_graph(current_graph, new_partition)
+            with self.profiler.phase("louvain.aggregate"):
+                current_graph = self._aggregate_graph(current_graph, new_partition)
             if len(current_graph.nodes()) == 1:
                 break
                 
-        self.partition = partition_map
+        self.set_partition(partition_map)
         return self.partition
 
-    def _aggregate_graph(self, G, partition):
-        new_G = nx.Graph()
-        communities = set(partition.values())
-        new_G.add_nodes_from(communities)
-        
-        for u, v, data in G.edges(data=True):
-            w = data.get('weight', 1)
-            com_u = partition[u]
-            com_v = partition[v]
-            if new_G.has_edge(com_u, com_v):
-                new_G[com_u][com_v]['weight'] += w
+    def run_monte_carlo(self, n_runs=100, seed=None, max_workers=None, progress=None, mp_context=None):
+        """
+        Best-of-N multi-level Louvain over randomized node orders.
+
+        Runs are spread over a ProcessPoolExecutor whose workers read the graph
+        arrays from shared memory; each run's seed is derived from `seed`, so the
+        result does not depend on max_workers. The lowest-entropy run (earliest
+        on ties) becomes self.partition.
+        progress: optional callable, called as progress(runs_done, n_runs) after
+        each finished chunk; an exception it raises cancels the remaining runs.
+        mp_context: multiprocessing context for the worker pool (default: the
+        platform's). Multithreaded callers should pass a "spawn" or "forkserver"
+        context, since forking a process that runs other threads is unsafe.
+        Returns (best_partition, entropies) with entropies[i] the H of run i.
+        """
+        nodes, indptr, indices, data = self._arrays()
+        seeds = np.random.SeedSequence(seed).spawn(n_runs)
+        max_workers = min(max_workers or os.cpu_count() or 1, n_runs)
+        chunks = [c.tolist() for c in np.array_split(np.arange(n_runs), min(n_runs, max_workers * 4)) if len(c)]
+
+        results = []
+        def collect(result):
+            results.append(result)
+            self.profiler.count("monte_carlo_runs", len(result[0]))
+            if progress is not None:
+                progress(sum(len(r[0]) for r in results), n_runs)
+
+        with self.profiler.phase("louvain.monte_carlo"):
+            if max_workers <= 1:
+                for c in chunks:
+                    collect(_monte_carlo_chunk(c, [seeds[i] for i in c], (indptr, indices, data)))
             else:
-                new_G.add_edge(com_u, com_v, weight=w)
-                
-        # Handle nodes with no edges but potential self-loops from previous aggregation
-        for node in G.nodes():
-            com = partition[node]
-            # Internal weights become self-loops in the aggregated graph
-            # This is handled by u,v iteration if self-loops existed.
-            # But we must ensure all nodes are present.
-        
-        return new_G
+                # Compile the kernels once so forked workers inherit them (spawned ones compile their own)
+                SILouvainArrayPass(indptr[:1].copy(), indices[:0].copy(), data[:0].copy()).optimize()
+                blocks, specs = _share_arrays((indptr, indices, data))
+                try:
+                    with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context,
+                                             initializer=_attach_shared_graph, initargs=(specs,)) as pool:
+                        try:
+                            for result in pool.map(_monte_carlo_chunk, chunks, [[seeds[i] for i in c] for c in chunks]):
+                                collect(result)
+                        except BaseException:
+                            pool.shutdown(cancel_futures=True)
+                            raise
+                finally:
+                    for shm in blocks:
+                        shm.close()
+                        shm.unlink()
+
+        entropies = [0.0] * n_runs
+        best_run, best_labels = None, None
+        for run_ids, chunk_h, chunk_best, chunk_labels in results:
+            for run_id, h in zip(run_ids, chunk_h):
+                entropies[run_id] = h
+            if best_run is None or entropies[chunk_best] < entropies[best_run] \
+                    or (entropies[chunk_best] == entropies[best_run] and chunk_best < best_run):
+                best_run, best_labels = chunk_best, chunk_labels
+
+        self._set_labels(nodes, best_labels)
+        return self.partition, entropies
+
+    def _aggregate_graph(self, G, partition):
+        # Internal weights become self-loops in the aggregated graph. Communities are
+        # ordered by their representative's position in G, like np.unique in
+        # louvain_labels, so both engines build the same level graph.
+        position = {node: i for i, node in enumerate(G.nodes())}
+        return aggregate_graph(G, partition, communities=sorted(set(partition.values()), key=position.__getitem__))
 
 class SILouvainOptimizerPass(StructuralEntropyBase):
     """Internal helper for a single pass of Louvain moves."""
+    profiler = NULL_PROFILER
+
     def optimize(self):
         modified = True
         while modified:
@@ -71,97 +369,14 @@ class SILouvainOptimizerPass(StructuralEntropyBase):
     def _one_pass(self):
         nodes = list(self.G.nodes())
         any_improvement = False
+        moves = 0
         
         for node in nodes:
-            best_community = self.partition[node]
-            min_delta = 1e-10 # Use a small epsilon for stability
-            
-            # Find neighboring communities
-            neighbor_communities = set()
-            for neighbor in self.G.neighbors(node):
-                neighbor_communities.add(self.partition[neighbor])
-            
-            for community in neighbor_communities:
-                if community == self.partition[node]: continue
-                
-                delta = self._calculate_delta(node, community)
-                if delta < -min_delta:
-                    min_delta = -delta
-                    best_community = community
-            
+            best_community = self._best_community(node)
             if best_community != self.partition[node]:
                 self._move_node(node, best_community)
                 any_improvement = True
+                moves += 1
                 
+        self.profiler.record("moves_per_pass", moves)
         return any_improvement
-
-    def _calculate_delta(self, node, target_community):
-        # (Same calculation logic as before)
-        old_community = self.partition[node]
-        
-        entropy_before = self.calculate_community_entropy(old_community) + \
-                         self.calculate_community_entropy(target_community)
-        
-        degree = self.G.degree(node, weight='weight') or 0
-        v_old_after = self.V_C[old_community] - degree
-        v_new_after = self.V_C[target_community] + degree
-        
-        dlog2d_node = self.dlog2d_per_node[node]
-        dlog2d_old_after = self.dlog2d_per_community[old_community] - dlog2d_node
-        dlog2d_new_after = self.dlog2d_per_community[target_community] + dlog2d_node
-
-        g_old_after = self.g_C[old_community]
-        g_new_after = self.g_C[target_community]
-        
-        # Self-loops on 'node' don't contribute to g_C changes when moving
-        # but the cut to target and others does.
-        for neighbor, data in self.G[node].items():
-            if neighbor == node: continue
-            w = data.get('weight', 1)
-            if self.partition[neighbor] == old_community:
-                g_old_after += w
-            else:
-                g_old_after -= w
-            
-            if self.partition[neighbor] == target_community:
-                g_new_after -= w
-            else:
-                g_new_after += w
-
-        def local_h(v, g, dl):
-            if v <= 0: return 0
-            h = - (g / (2 * self.W)) * math.log2(v / (2 * self.W))
-            h += (v / (2 * self.W)) * math.log2(v)
-            h -= dl / (2 * self.W)
-            return h
-
-        entropy_after = local_h(v_old_after, g_old_after, dlog2d_old_after) + \
-                        local_h(v_new_after, g_new_after, dlog2d_new_after)
-        
-        return entropy_after - entropy_before
-
-    def _move_node(self, node, target_community):
-        source_community = self.partition[node]
-        degree = self.G.degree(node, weight='weight') or 0
-        
-        self.V_C[source_community] -= degree
-        self.dlog2d_per_community[source_community] -= self.dlog2d_per_node[node]
-        
-        self.V_C[target_community] += degree
-        self.dlog2d_per_community[target_community] += self.dlog2d_per_node[node]
-
-        for neighbor, data in self.G[node].items():
-            if neighbor == node: continue
-            w = data.get('weight', 1)
-            if self.partition[neighbor] == source_community:
-                self.g_C[source_community] += w
-            else:
-                self.g_C[source_community] -= w
-            
-            if self.partition[neighbor] == target_community:
-                self.g_C[target_community] -= w
-            else:
-                self.g_C[target_community] += w
-        
-        self.partition[node] = target_community
-
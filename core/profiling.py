@@ -0,0 +1,114 @@
+import time
+from collections import defaultdict
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.timings[self.name] += time.perf_counter() - self.start
+        self.profiler.phase_calls[self.name] += 1
+        return False
+
+
+class Profiler:
+    """
+    Opt-in counters, per-pass series and per-phase wall time for the SI optimizers.
+
+    Optimizers take profile=True and expose the result as `.stats`; with profiling
+    off they share the disabled NULL_PROFILER, whose calls return at the first check
+    (phase() hands back one shared no-op context), so instrumented loops cost a
+    method call per event. Counters are only bumped at per-merge / per-sweep
+    granularity, never inside the numba kernels.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.counters = defaultdict(int)
+        self.series = defaultdict(list)  # e.g. node moves of every sweep
+        self.timings = defaultdict(float)
+        self.phase_calls = defaultdict(int)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+    def record(self, name, value):
+        if self.enabled:
+            self.series[name].append(value)
+
+    def phase(self, name):
+        """Context manager adding the wall time of its block to timings[name]."""
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def add_heap(self, stats, prefix="heap"):
+        """Fold a LazyHeap.stats() dict into the counters."""
+        if self.enabled:
+            for key in ("pushes", "pops", "stale_pops", "compactions"):
+                self.counters[f"{prefix}_{key}"] += stats[key]
+            self.counters[f"{prefix}_peak_size"] = max(self.counters[f"{prefix}_peak_size"], stats["peak_size"])
+
+    def merge(self, other):
+        """Add another profiler's numbers into this one (e.g. from a worker)."""
+        if not self.enabled:
+            return
+        for name, n in other.counters.items():
+            if name.endswith("_peak_size"):
+                self.counters[name] = max(self.counters[name], n)
+            else:
+                self.counters[name] += n
+        for name, values in other.series.items():
+            self.series[name].extend(values)
+        for name, seconds in other.timings.items():
+            self.timings[name] += seconds
+            self.phase_calls[name] += other.phase_calls[name]
+
+    def to_dict(self):
+        return {
+            "counters": dict(self.counters),
+            "series": {name: list(values) for name, values in self.series.items()},
+            "phases": {name: {"seconds": self.timings[name], "calls": self.phase_calls[name]}
+                       for name in self.timings},
+        }
+
+    def report(self):
+        """Human-readable summary: phases by total time, then counters."""
+        lines = [f"{'phase':<28} {'seconds':>10} {'calls':>8}"]
+        for name, seconds in sorted(self.timings.items(), key=lambda item: -item[1]):
+            lines.append(f"{name:<28} {seconds:>10.4f} {self.phase_calls[name]:>8}")
+        for name, n in sorted(self.counters.items()):
+            lines.append(f"{name:<28} {n:>10}")
+        for name, values in sorted(self.series.items()):
+            shown = ", ".join(str(v) for v in values[:12]) + (", ..." if len(values) > 12 else "")
+            lines.append(f"{name:<28} [{shown}]")
+        return "\n".join(lines)
+
+
+NULL_PROFILER = Profiler(enabled=False)
+
+
+def make_profiler(profile):
+    """profile=True -> a fresh Profiler, a Profiler -> itself (shared), falsy -> NULL_PROFILER."""
+    if isinstance(profile, Profiler):
+        return profile
+    return Profiler() if profile else NULL_PROFILER
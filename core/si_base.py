@@ -1,7 +1,7 @@
 import numpy as np
 import math
 import networkx as nx
-from collections import defaultdict
+from collections import defaultdict, deque
 
 class StructuralEntropyBase:
     """
@@ -10,7 +10,8 @@ class StructuralEntropyBase:
     """
     def __init__(self, graph):
         self.G = graph
-        self.W = self.G.size(weight='weight')
+        self._weighted_size = self.G.size(weight='weight')
+        self.W = self._weighted_size
         if self.W == 0:
             self.W = self.G.size()
         
@@ -19,6 +20,7 @@ class StructuralEntropyBase:
         self.g_C = defaultdict(float) # Degree of community (out-edges)
         self.dlog2d_per_community = defaultdict(float)
         self.dlog2d_per_node = {}
+        self._dirty = set() # nodes touched by incremental updates since the last reoptimize()
 
         self._initialize_metrics()
 
@@ -34,6 +36,255 @@ class StructuralEntropyBase:
             self_loop = self.G.get_edge_data(node, node, default={}).get('weight', 0)
             self.g_C[node] = degree - (2 * self_loop)
 
+    def set_partition(self, partition):
+        """Replace the partition and rebuild V_C, g_C and dlog2d_per_community from it in O(E)."""
+        self.partition = dict(partition)
+        self.V_C.clear()
+        self.g_C.clear()
+        self.dlog2d_per_community.clear()
+        for node in self.G.nodes():
+            community = self.partition[node]
+            degree = self.G.degree(node, weight='weight') or 1
+            self_loop = self.G.get_edge_data(node, node, default={}).get('weight', 0)
+            self.V_C[community] += degree
+            self.dlog2d_per_community[community] += self.dlog2d_per_node[node]
+            self.g_C[community] += degree - (2 * self_loop)
+
+        # Edges inside a community do not leave it
+        for u, v, data in self.G.edges(data=True):
+            if u != v and self.partition[u] == self.partition[v]:
+                self.g_C[self.partition[u]] -= 2 * data.get('weight', 1)
+
+    def _node_contribution(self, node):
+        """A node's (volume, d*log2(d), g) contribution to its community, as _initialize_metrics counts it."""
+        degree = self.G.degree(node, weight='weight') or 1
+        self_loop = self.G.get_edge_data(node, node, default={}).get('weight', 0)
+        return degree, degree * math.log2(degree), degree - (2 * self_loop)
+
+    def _set_edge(self, u, v, weight):
+        """Set the weight of (u, v) (None removes it) and patch the metrics of both endpoints in O(deg)."""
+        ends = [u] if u == v else [u, v]
+        old_terms = [self._node_contribution(node) for node in ends]
+        old_w = self.G[u][v].get('weight', 1) if self.G.has_edge(u, v) else 0
+        if weight is None:
+            self.G.remove_edge(u, v)
+            weight = 0
+        else:
+            self.G.add_edge(u, v, weight=weight)
+
+        self._weighted_size += weight - old_w
+        self.W = self._weighted_size if self._weighted_size != 0 else self.G.size()
+        for node, (v_old, dl_old, g_old) in zip(ends, old_terms):
+            community = self.partition[node]
+            v_new, dl_new, g_new = self._node_contribution(node)
+            self.V_C[community] += v_new - v_old
+            self.dlog2d_per_community[community] += dl_new - dl_old
+            self.g_C[community] += g_new - g_old
+            self.dlog2d_per_node[node] = dl_new
+            self._dirty.add(node)
+        # Edges inside a community do not leave it
+        if u != v and self.partition[u] == self.partition[v]:
+            self.g_C[self.partition[u]] -= 2 * (weight - old_w)
+
+    def add_node(self, node, community=None):
+        """Add an isolated node to `community` (default: its own label, i.e. a new singleton)."""
+        if node in self.partition: return
+        self.G.add_node(node)
+        community = node if community is None else community
+        self.partition[node] = community
+        v, dl, g = self._node_contribution(node)
+        self.V_C[community] += v
+        self.dlog2d_per_community[community] += dl
+        self.g_C[community] += g
+        self.dlog2d_per_node[node] = dl
+        self._dirty.add(node)
+
+    def remove_node(self, node):
+        """Remove a node and its edges, O(deg) per incident edge."""
+        for neighbor in list(self.G[node]):
+            self._set_edge(node, neighbor, None)
+        community = self.partition.pop(node)
+        v, dl, g = self._node_contribution(node)
+        self.V_C[community] -= v
+        self.dlog2d_per_community[community] -= dl
+        self.g_C[community] -= g
+        del self.dlog2d_per_node[node]
+        self._dirty.discard(node)
+        self.G.remove_node(node)
+
+    def add_edge(self, u, v, weight=1):
+        """Add the edge (u, v) or set its weight, adding missing endpoints as singletons."""
+        self.add_node(u)
+        self.add_node(v)
+        self._set_edge(u, v, weight)
+
+    def remove_edge(self, u, v):
+        self._set_edge(u, v, None)
+
+    def reoptimize(self, nodes=None):
+        """
+        Local repair of the partition after incremental updates.
+        Applies Louvain node moves (same rule as SILouvainOptimizerPass) starting from
+        `nodes` (default: the nodes touched since the last call) and re-queues the
+        neighbours of every node that moves, so only the affected communities are revisited.
+        Returns the number of moves.
+        """
+        if nodes is None:
+            nodes = self._dirty
+        queue = deque(node for node in nodes if node in self.partition)
+        queued = set(queue)
+        self._dirty = set()
+        moves = 0
+        while queue:
+            node = queue.popleft()
+            queued.discard(node)
+            best_community = self._best_community(node)
+            if best_community == self.partition[node]: continue
+            self._move_node(node, best_community)
+            moves += 1
+            for neighbor in self.G.neighbors(node):
+                if neighbor not in queued:
+                    queued.add(neighbor)
+                    queue.append(neighbor)
+        return moves
+
+    def _best_community(self, node):
+        """Neighbouring community whose entropy delta for `node` is lowest (own community unless one improves)."""
+        best_community = self.partition[node]
+        min_delta = 1e-10 # Use a small epsilon for stability
+        
+        # Find neighboring communities
+        neighbor_communities = dict.fromkeys(self.partition[neighbor] for neighbor in self.G.neighbors(node))
+        
+        for community in neighbor_communities:
+            if community == self.partition[node]: continue
+            
+            delta = self._calculate_delta(node, community)
+            if delta < -min_delta:
+                min_delta = -delta
+                best_community = community
+        return best_community
+
+    def _move_deltas(self, node, candidates):
+        """
+        Entropy delta of moving `node` into each candidate community (same result as
+        _calculate_delta). The node's weight to every community is gathered in one
+        neighbour scan, so all candidates together cost O(deg).
+        """
+        own = self.partition[node]
+        degree = self.G.degree(node, weight='weight')
+        # An isolated node counts as unit volume that all leaves its community (see _node_contribution)
+        k_tot = 0 if degree else 1
+        degree = degree or 1
+        dlog2d_node = self.dlog2d_per_node[node]
+        k_comm = defaultdict(float)
+        for neighbor, data in self.G[node].items():
+            if neighbor == node: continue
+            w = data.get('weight', 1)
+            k_comm[self.partition[neighbor]] += w
+            k_tot += w
+
+        def local_h(v, g, dl):
+            if v <= 0: return 0
+            h = - (g / (2 * self.W)) * math.log2(v / (2 * self.W))
+            h += (v / (2 * self.W)) * math.log2(v)
+            h -= dl / (2 * self.W)
+            return h
+
+        h_old = self.calculate_community_entropy(own)
+        h_old_after = local_h(self.V_C[own] - degree,
+                              self.g_C[own] + k_comm[own] - (k_tot - k_comm[own]),
+                              self.dlog2d_per_community[own] - dlog2d_node)
+        deltas = {}
+        for community in candidates:
+            if community == own: continue
+            h_new_after = local_h(self.V_C[community] + degree,
+                                  self.g_C[community] - k_comm[community] + (k_tot - k_comm[community]),
+                                  self.dlog2d_per_community[community] + dlog2d_node)
+            deltas[community] = h_old_after + h_new_after - h_old - self.calculate_community_entropy(community)
+        return deltas
+
+    def _calculate_delta(self, node, target_community):
+        # (Same calculation logic as before)
+        old_community = self.partition[node]
+        
+        entropy_before = self.calculate_community_entropy(old_community) + \
+                         self.calculate_community_entropy(target_community)
+        
+        degree = self.G.degree(node, weight='weight')
+        isolated = not degree
+        degree = degree or 1
+        v_old_after = self.V_C[old_community] - degree
+        v_new_after = self.V_C[target_community] + degree
+        
+        dlog2d_node = self.dlog2d_per_node[node]
+        dlog2d_old_after = self.dlog2d_per_community[old_community] - dlog2d_node
+        dlog2d_new_after = self.dlog2d_per_community[target_community] + dlog2d_node
+
+        g_old_after = self.g_C[old_community]
+        g_new_after = self.g_C[target_community]
+        if isolated:
+            # Its unit volume is all cut (see _node_contribution)
+            g_old_after -= 1
+            g_new_after += 1
+        
+        # Self-loops on 'node' don't contribute to g_C changes when moving
+        # but the cut to target and others does.
+        for neighbor, data in self.G[node].items():
+            if neighbor == node: continue
+            w = data.get('weight', 1)
+            if self.partition[neighbor] == old_community:
+                g_old_after += w
+            else:
+                g_old_after -= w
+            
+            if self.partition[neighbor] == target_community:
+                g_new_after -= w
+            else:
+                g_new_after += w
+
+        def local_h(v, g, dl):
+            if v <= 0: return 0
+            h = - (g / (2 * self.W)) * math.log2(v / (2 * self.W))
+            h += (v / (2 * self.W)) * math.log2(v)
+            h -= dl / (2 * self.W)
+            return h
+
+        entropy_after = local_h(v_old_after, g_old_after, dlog2d_old_after) + \
+                        local_h(v_new_after, g_new_after, dlog2d_new_after)
+        
+        return entropy_after - entropy_before
+
+    def _move_node(self, node, target_community):
+        source_community = self.partition[node]
+        degree = self.G.degree(node, weight='weight')
+        if not degree:
+            # An isolated node's unit volume is all cut (see _node_contribution)
+            degree = 1
+            self.g_C[source_community] -= 1
+            self.g_C[target_community] += 1
+        
+        self.V_C[source_community] -= degree
+        self.dlog2d_per_community[source_community] -= self.dlog2d_per_node[node]
+        
+        self.V_C[target_community] += degree
+        self.dlog2d_per_community[target_community] += self.dlog2d_per_node[node]
+
+        for neighbor, data in self.G[node].items():
+            if neighbor == node: continue
+            w = data.get('weight', 1)
+            if self.partition[neighbor] == source_community:
+                self.g_C[source_community] += w
+            else:
+                self.g_C[source_community] -= w
+            
+            if self.partition[neighbor] == target_community:
+                self.g_C[target_community] -= w
+            else:
+                self.g_C[target_community] += w
+        
+        self.partition[node] = target_community
+
     def calculate_community_entropy(self, community_label):
         V_C = self.V_C[community_label]
         g_C = self.g_C[community_label]
@@ -0,0 +1,192 @@
+import numpy as np
+import scipy.sparse as sp
+import networkx as nx
+
+
+def as_csr(graph, num_nodes=None):
+    """
+    Convert a graph into a symmetric float64 CSR adjacency matrix.
+
+    Accepts a scipy.sparse matrix, a dense adjacency array, a NetworkX graph
+    (nodes are indexed in G.nodes() order) or an edge list of (u, v) / (u, v, w)
+    rows over integer node ids. A square 2-D array is always read as a dense
+    adjacency; call edges_to_csr directly for 2- or 3-edge lists. Edge lists are
+    treated as undirected and duplicate edges are summed; a self-loop (u, u, w)
+    is stored once as A[u, u] = w.
+
+    A canonical float64 CSR input (e.g. load_csr's memory-mapped graphs) is
+    returned without copying or writing to its arrays.
+    """
+    if isinstance(graph, nx.Graph):
+        csr = sp.csr_matrix(nx.to_scipy_sparse_array(graph, weight='weight', dtype=np.float64))
+    elif sp.issparse(graph):
+        csr = sp.csr_matrix(graph, dtype=np.float64)
+    else:
+        arr = np.asarray(graph)
+        if arr.ndim == 2 and arr.shape[0] == arr.shape[1]:
+            csr = sp.csr_matrix(arr, dtype=np.float64)
+        else:
+            csr = edges_to_csr(arr, num_nodes)
+    # Clean up in place only when needed, so read-only arrays are left alone
+    if not csr.has_canonical_format:
+        csr.sum_duplicates()
+    if (csr.data == 0).any():
+        csr.eliminate_zeros()
+    return csr
+
+
+def edges_to_csr(edges, num_nodes=None):
+    """Build a symmetric CSR matrix from an (E, 2) or (E, 3) edge array in O(E)."""
+    edges = np.asarray(edges)
+    if edges.size == 0:
+        n = num_nodes or 0
+        return sp.csr_matrix((n, n), dtype=np.float64)
+    if edges.ndim != 2 or edges.shape[1] not in (2, 3):
+        raise ValueError("edge list must have shape (E, 2) or (E, 3)")
+    u = edges[:, 0].astype(np.int64)
+    v = edges[:, 1].astype(np.int64)
+    w = edges[:, 2].astype(np.float64) if edges.shape[1] == 3 else np.ones(len(u))
+    if num_nodes is None:
+        num_nodes = int(max(u.max(), v.max())) + 1
+
+    # Mirror every non-loop edge so the matrix is symmetric
+    off = u != v
+    rows = np.concatenate([u, v[off]])
+    cols = np.concatenate([v, u[off]])
+    vals = np.concatenate([w, w[off]])
+    return sp.csr_matrix((vals, (rows, cols)), shape=(num_nodes, num_nodes))
+
+
+def group_adjacency(csr, groups):
+    """
+    Sum edge weights between disjoint node groups in O(sum of group degrees).
+
+    groups: sequence of node index arrays. Returns an (m, m) CSR matrix C where
+    C[a, b] is the total weight of A[u, v] over u in group a, v in group b.
+    Edges leaving the union of the groups are ignored.
+    """
+    m = len(groups)
+    sizes = np.fromiter((len(g) for g in groups), dtype=np.int64, count=m)
+    if m == 0 or sizes.sum() == 0:
+        return sp.csr_matrix((m, m), dtype=np.float64)
+    members = np.concatenate([np.asarray(g, dtype=np.int64) for g in groups])
+    owner = np.repeat(np.arange(m), sizes)
+    order = np.argsort(members, kind='stable')
+    sorted_members, sorted_owner = members[order], owner[order]
+
+    # Gather every stored entry of the member rows
+    offsets, counts = _row_entries(csr, members)
+    rows = np.repeat(owner, counts)
+    cols = csr.indices[offsets]
+    weights = csr.data[offsets]
+
+    # Keep only entries whose column is also a member, mapped to its group
+    pos = np.minimum(np.searchsorted(sorted_members, cols), len(sorted_members) - 1)
+    hit = sorted_members[pos] == cols
+    out = sp.coo_matrix((weights[hit], (rows[hit], sorted_owner[pos[hit]])), shape=(m, m))
+    return out.tocsr()
+
+
+def induced_subgraph(csr, nodes):
+    """
+    CSR arrays of the subgraph induced by `nodes`, in O(sum of their degrees).
+
+    Local index a stands for nodes[a]. Returns (indptr, indices, data, vol), where
+    vol[a] is the weight of nodes[a]'s edges inside the subgraph; rows keep the
+    column order of csr. The input matrix is only read.
+    """
+    nodes = np.asarray(nodes, dtype=np.int64)
+    m = len(nodes)
+    if m == 0:
+        return np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+    order = np.argsort(nodes, kind='stable')
+    sorted_nodes = nodes[order]
+
+    offsets, counts = _row_entries(csr, nodes)
+    rows = np.repeat(np.arange(m), counts)
+    cols = csr.indices[offsets]
+    pos = np.minimum(np.searchsorted(sorted_nodes, cols), m - 1)
+    hit = sorted_nodes[pos] == cols
+    rows, indices, data = rows[hit], order[pos[hit]], csr.data[offsets[hit]]
+
+    indptr = np.zeros(m + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=m), out=indptr[1:])
+    vol = np.bincount(rows, weights=data, minlength=m)
+    return indptr, indices, data, vol
+
+
+def _row_entries(csr, rows):
+    """Positions of all stored entries of `rows` in csr.indices / csr.data, row after row, and the row lengths."""
+    starts = csr.indptr[rows].astype(np.int64)
+    counts = csr.indptr[rows + 1] - starts
+    offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+    return offsets, counts
+
+
+def adjacency_arrays(G, weight='weight'):
+    """
+    CSR arrays (indptr, indices, data) of a NetworkX graph in G.nodes() order.
+    Unlike as_csr, each row keeps G's own neighbour order, so array kernels
+    visit neighbours exactly as a loop over G[node] would.
+    """
+    nodes = list(G.nodes())
+    index = {n: i for i, n in enumerate(nodes)}
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    indices = []
+    data = []
+    for i, u in enumerate(nodes):
+        nbrs = G.adj[u]
+        indptr[i + 1] = indptr[i] + len(nbrs)
+        indices.extend(index[v] for v in nbrs)
+        data.extend(d.get(weight, 1) for d in nbrs.values())
+    return nodes, indptr, np.array(indices, dtype=np.int64), np.array(data, dtype=np.float64)
+
+
+def aggregate(indptr, indices, data, labels, n_comms=None):
+    """
+    Coarsen a symmetric CSR graph by community labels (0..n_comms-1) in O(E).
+
+    Edges between communities are summed. Edges inside a community become a
+    self-loop stored with the NetworkX convention (a loop of weight w adds 2w
+    to the weighted degree), so degrees and the total weight are preserved.
+    Returns the (indptr, indices, data) arrays of the coarse graph.
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    if n_comms is None:
+        n_comms = int(labels.max()) + 1 if len(labels) else 0
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    src, dst = labels[rows], labels[indices]
+    # Internal non-loop edges are stored twice (u->v and v->u); loops once
+    weights = np.where((src == dst) & (rows != indices), data / 2.0, data)
+    coarse = sp.csr_matrix((weights, (src, dst)), shape=(n_comms, n_comms))
+    coarse.sum_duplicates()
+    coarse.eliminate_zeros()
+    coarse.sort_indices()
+    return coarse.indptr.astype(np.int64), coarse.indices.astype(np.int64), coarse.data
+
+
+def aggregate_graph(G, partition, communities=None):
+    """
+    Coarsen a weighted NetworkX graph by a {node: community} partition in O(E).
+
+    Runs aggregate() on the graph's CSR form and returns a NetworkX graph whose
+    nodes are the community labels (in `communities` order; default: first seen
+    in G.nodes() order). Edges inside a community, self-loops included, become
+    one self-loop, so every community's degree equals its volume in G.
+    """
+    nodes = list(G.nodes())
+    if communities is None:
+        communities = list(dict.fromkeys(partition[n] for n in nodes))
+    index = {c: i for i, c in enumerate(communities)}
+    labels = np.fromiter((index[partition[n]] for n in nodes), dtype=np.int64, count=len(nodes))
+    adj = as_csr(G)
+    indptr, indices, data = aggregate(adj.indptr, adj.indices, adj.data, labels, len(communities))
+
+    H = nx.Graph()
+    H.add_nodes_from(communities)
+    rows = np.repeat(np.arange(len(communities)), np.diff(indptr))
+    upper = indices >= rows
+    H.add_weighted_edges_from(zip([communities[i] for i in rows[upper].tolist()],
+                                  [communities[j] for j in indices[upper].tolist()],
+                                  data[upper].tolist()))
+    return H
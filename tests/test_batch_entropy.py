@@ -0,0 +1,122 @@
+import math
+import os
+import subprocess
+import sys
+
+import networkx as nx
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web'))
+
+from core.entropy import batch_entropy
+from core.si_base import StructuralEntropyBase
+from app import LabManager
+
+
+def reference_entropy(G, labels, vol=None, node_terms=True):
+    """2D structural entropy with NetworkX degrees and cuts, like the lab's calculate_metrics."""
+    nodes = list(G.nodes())
+    VOL = vol if vol is not None else sum(d for _, d in G.degree(weight='weight'))
+    h = 0.0
+    for c in set(labels):
+        members = [n for n, l in zip(nodes, labels) if l == c]
+        v = sum(d for _, d in G.degree(members, weight='weight'))
+        if v <= 0:
+            continue
+        h -= nx.cut_size(G, members, weight='weight') / VOL * math.log2(v / VOL)
+        if node_terms:
+            h -= sum(d / VOL * math.log2(d / v) for _, d in G.degree(members, weight='weight') if d > 0)
+    return h
+
+
+def weighted_graph():
+    G = nx.connected_caveman_graph(3, 5)
+    for i, (u, v) in enumerate(G.edges()):
+        G[u][v]['weight'] = 1 + i % 4
+    G.add_edge(0, 0, weight=3)  # self-loops count twice in the degree
+    G.add_edge(7, 7, weight=1)
+    return G
+
+
+def test_matches_structural_entropy_base():
+    G = weighted_graph()
+    rng = np.random.default_rng(0)
+    rows = rng.integers(0, 4, (20, G.number_of_nodes()))
+    rows[0] = [n // 5 for n in G.nodes()]
+    scores = batch_entropy(G, rows)
+    for row, score in zip(rows, scores):
+        se = StructuralEntropyBase(G)
+        se.set_partition(dict(zip(G.nodes(), row.tolist())))
+        assert score == pytest.approx(se.get_total_entropy(), abs=1e-12)
+
+
+def test_single_row_and_label_values():
+    G = weighted_graph()
+    labels = np.array([n // 5 for n in G.nodes()])
+    h = batch_entropy(G, labels)
+    assert isinstance(h, float)
+    # Only the grouping matters, not the label values
+    assert batch_entropy(G, labels * 100 - 7) == pytest.approx(h, abs=1e-12)
+    assert batch_entropy(G, np.array(["c", "a", "b"])[labels]) == pytest.approx(h, abs=1e-12)
+    assert batch_entropy(G, np.stack([labels, labels * 3 + 1]))[1] == pytest.approx(h, abs=1e-12)
+
+
+def test_isolated_nodes_contribute_nothing():
+    G = weighted_graph()
+    G.add_nodes_from(["x", "y"])
+    labels = [0 if n == "x" else (1 if n == "y" else n // 5) for n in G.nodes()]
+    assert batch_entropy(G, labels) == pytest.approx(reference_entropy(G, labels), abs=1e-12)
+    # A community holding only isolated nodes has zero volume
+    labels = [9 if n in ("x", "y") else n // 5 for n in G.nodes()]
+    assert batch_entropy(G, labels) == pytest.approx(reference_entropy(G, labels), abs=1e-12)
+
+
+@pytest.mark.parametrize("vol", [None, 500.0])
+@pytest.mark.parametrize("node_terms", [True, False])
+def test_vol_and_node_terms(vol, node_terms):
+    G = weighted_graph()
+    rng = np.random.default_rng(1)
+    rows = rng.integers(0, 5, (6, G.number_of_nodes()))
+    scores = batch_entropy(G, rows, vol=vol, node_terms=node_terms)
+    for row, score in zip(rows, scores):
+        assert score == pytest.approx(reference_entropy(G, row.tolist(), vol, node_terms), abs=1e-12)
+
+
+def test_csr_input_and_shape_check():
+    G = weighted_graph()
+    labels = [n // 5 for n in G.nodes()]
+    adj = nx.to_scipy_sparse_array(G, weight='weight')
+    assert batch_entropy(adj, labels) == pytest.approx(batch_entropy(G, labels), abs=1e-12)
+    with pytest.raises(ValueError):
+        batch_entropy(G, labels[:-1])
+
+
+def test_matches_lab_metrics():
+    lab = LabManager()
+    lab.load_preset("karate")
+    G = lab.get_current()["G"]
+    # Zero-degree node "11", and a level volume that differs from G0's
+    lab.update_edge("0", "11", 0.0)
+    lab.update_edge("0", "1", 7.0)
+    partition = {n: i % 4 for i, n in enumerate(G.nodes())}
+    labels = [partition[n] for n in G.nodes()]
+    metrics = lab.calculate_metrics(partition)
+    assert batch_entropy(G, labels, vol=metrics["vol_total"]) == pytest.approx(metrics["se_2d"], abs=1e-6)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forking_after_a_parallel_launch_exits():
+    # Worker pools fork after batch_entropy has started numba's threads; the
+    # parent must still exit (it hung at exit on the TBB threading layer)
+    code = ("import os, networkx as nx\n"
+            "from core.entropy import batch_entropy\n"
+            "batch_entropy(nx.karate_club_graph(), [[0] * 34, [1] * 34])\n"
+            "pid = os.fork()\n"
+            "if pid == 0:\n"
+            "    os._exit(0)\n"
+            "os.waitpid(pid, 0)\n")
+    env = {k: v for k, v in os.environ.items() if k != "NUMBA_THREADING_LAYER"}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", code], cwd=root, env=env, timeout=60, check=True)
@@ -0,0 +1,82 @@
+import math
+import os
+import sys
+
+import networkx as nx
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.brute_force_si import BruteForceSI, all_partitions
+
+
+def reference_entropy(G, max_children=None):
+    """Optimal encoding-tree entropy by plain recursion over all_partitions, with NetworkX cuts and volumes."""
+    VOL = sum(d for _, d in G.degree(weight='weight'))
+    vol = lambda C: sum(d for _, d in G.degree(C, weight='weight'))
+    memo = {}
+
+    def f(S):
+        if len(S) == 1:
+            return 0.0
+        if S not in memo:
+            V_S = vol(S)
+            memo[S] = min(
+                sum(-(nx.cut_size(G, C, weight='weight') / VOL) * math.log2(vol(C) / V_S) + f(frozenset(C))
+                    for C in blocks)
+                for blocks in all_partitions(sorted(S), max_blocks=max_children) if len(blocks) > 1)
+        return memo[S]
+
+    return f(frozenset(G.nodes()))
+
+
+def tree_entropy(G, tree):
+    """Entropy of a tree returned by BruteForceSI.solve(), recomputed from its partitions."""
+    VOL = sum(d for _, d in G.degree(weight='weight'))
+    vol = lambda C: sum(d for _, d in G.degree(C, weight='weight'))
+
+    def h(node, V_parent):
+        if "id" in node:
+            return 0.0
+        V = vol([n for block in node["partition"] for n in block])
+        return sum(-(nx.cut_size(G, C, weight='weight') / VOL) * math.log2(vol(C) / V) + h(child, V)
+                   for C, child in zip(node["partition"], node["children"]))
+
+    return h(tree, VOL)
+
+
+def weighted_graph():
+    G = nx.Graph()
+    G.add_weighted_edges_from([(0, 1, 10), (1, 2, 1), (2, 3, 10), (3, 4, 2), (4, 5, 7), (5, 0, 1), (1, 4, 3)])
+    G.add_edge(2, 2, weight=4)  # self-loop
+    return G
+
+
+GRAPHS = {
+    "path5": nx.path_graph(5),
+    "weighted6": weighted_graph(),
+    "barbell7": nx.barbell_graph(3, 1),
+    "random7": nx.gnm_random_graph(7, 12, seed=3),
+}
+
+
+@pytest.mark.parametrize("name", list(GRAPHS))
+@pytest.mark.parametrize("max_children", [None, 2, 3])
+def test_matches_partition_enumeration(name, max_children):
+    G = GRAPHS[name]
+    h, tree = BruteForceSI(G, max_children=max_children).solve()
+    assert h == pytest.approx(reference_entropy(G, max_children), abs=1e-9)
+    assert tree_entropy(G, tree) == pytest.approx(h, abs=1e-9)
+
+
+def test_trivial_graphs():
+    assert BruteForceSI(nx.Graph()).solve() == (0.0, {"partition": [], "children": [], "h_total": 0.0})
+    G = nx.Graph()
+    G.add_node("a")
+    assert BruteForceSI(G).solve() == (0, {"id": "a"})
+
+
+def test_node_cap():
+    with pytest.raises(ValueError):
+        BruteForceSI(nx.path_graph(17)).solve()
+    assert BruteForceSI(nx.path_graph(3), max_nodes=2).max_nodes == 2
@@ -0,0 +1,184 @@
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from core.graph_io import _index_dtype, ingest, load_csr, npz_edge_chunks, write_csr
+from core.greedy_si import GreedySIOptimizer
+from core.louvain_optimizer import SILouvainOptimizer
+from core.sparse_graph import as_csr, edges_to_csr
+from graph_families import sbm_graph
+from sip import PartitionTree
+
+
+def messy_edges(seed=0, n=40, m=300):
+    """Weighted edges with both-direction duplicates, zero weights, self-loops and a pair summing to zero."""
+    rng = np.random.default_rng(seed)
+    edges = np.column_stack([rng.integers(0, n, m), rng.integers(0, n, m), rng.integers(0, 4, m)]).astype(np.float64)
+    edges[:20, :2] = edges[20:40, 1::-1]  # reversed duplicates
+    edges[40:50, 1] = edges[40:50, 0]     # self-loops
+    edges[50:60, 2] = 0
+    return np.vstack([edges, [[3, 5, 2.5], [5, 3, -2.5], [7, 7, 1.5], [7, 7, 2.0]]])
+
+
+def expected_csr(edges, num_nodes=None):
+    return as_csr(edges_to_csr(edges, num_nodes))
+
+
+def assert_same_graph(csr, expected):
+    assert csr.shape == expected.shape
+    assert csr.has_canonical_format and not (csr.data == 0).any()
+    assert (csr != expected).nnz == 0
+
+
+def write_edge_list(path, edges, delimiter, header=None):
+    with open(path, "w") as f:
+        if header:
+            f.write(header + "\n")
+        f.write("# generated edge list\n")
+        for u, v, w in edges:
+            f.write(delimiter.join([str(int(u)), str(int(v)), repr(float(w))]) + "\n")
+
+
+@pytest.mark.parametrize("name, delimiter, header", [
+    ("edges.tsv", "\t", None),
+    ("edges.csv", ",", "source,target,weight"),
+    ("edges.txt", " ", "u v w"),
+])
+@pytest.mark.parametrize("chunk_size", [7, 1_000_000])
+def test_edge_list_round_trip(tmp_path, name, delimiter, header, chunk_size):
+    edges = messy_edges()
+    src = str(tmp_path / name)
+    write_edge_list(src, edges, delimiter, header)
+    path = ingest(src, str(tmp_path / "csr"), chunk_size=chunk_size)
+    assert sorted(os.listdir(path)) == ["data.npy", "indices.npy", "indptr.npy", "meta.json"]
+    expected = expected_csr(edges)
+    assert_same_graph(load_csr(path, mmap=False), expected)
+    assert_same_graph(load_csr(path), expected)
+
+
+def test_unweighted_edges_and_num_nodes(tmp_path):
+    edges = messy_edges()[:, :2]
+    src = str(tmp_path / "edges.tsv")
+    np.savetxt(src, edges, fmt="%d", delimiter="\t")
+    # Trailing isolated nodes only exist when num_nodes says so
+    path = ingest(src, str(tmp_path / "csr"), num_nodes=50, chunk_size=11)
+    assert_same_graph(load_csr(path), expected_csr(edges, 50))
+    with pytest.raises(ValueError):
+        ingest(src, str(tmp_path / "small"), num_nodes=10)
+
+
+@pytest.mark.parametrize("save", [np.savez, np.savez_compressed])
+@pytest.mark.parametrize("columns", [2, 3])
+def test_npz_edges_input(tmp_path, save, columns):
+    edges = messy_edges()[:, :columns]
+    src = str(tmp_path / "edges.npz")
+    save(src, edges=edges.astype(np.int64 if columns == 2 else np.float64), other=np.zeros(3))
+    path = ingest(src, str(tmp_path / "csr"), chunk_size=13)
+    assert_same_graph(load_csr(path), expected_csr(edges))
+
+
+def test_npz_edges_are_streamed_in_chunks(tmp_path):
+    edges = messy_edges()
+    src = str(tmp_path / "edges.npz")
+    np.savez_compressed(src, edges=edges)
+    chunks = list(npz_edge_chunks(src, chunk_size=50))
+    assert [len(c) for c in chunks] == [50] * 6 + [4]
+    assert np.array_equal(np.vstack(chunks), edges)
+    # Only one chunk is held at a time
+    big = np.random.default_rng(0).random((500_000, 3))
+    np.savez_compressed(src, edges=big)
+    tracemalloc.start()
+    try:
+        total = sum(len(chunk) for chunk in npz_edge_chunks(src, chunk_size=10_000))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert total == len(big) and peak < big.nbytes / 10
+    # A Fortran-ordered member is read whole but yields the same rows
+    np.savez(src, edges=np.asfortranarray(edges))
+    assert np.array_equal(np.vstack(list(npz_edge_chunks(src, chunk_size=50))), edges)
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_scipy_npz_input(tmp_path, compressed):
+    edges = messy_edges()
+    # An uncanonical COO matrix: unsorted duplicates and explicit zeros
+    u, v, w = edges[:, 0], edges[:, 1], edges[:, 2]
+    off = u != v
+    coo = sp.coo_matrix((np.r_[w, w[off]], (np.r_[u, v[off]], np.r_[v, u[off]])), shape=(40, 40))
+    src = str(tmp_path / "adj.npz")
+    sp.save_npz(src, coo, compressed=compressed)
+    path = ingest(src, str(tmp_path / "csr"))
+    assert_same_graph(load_csr(path), expected_csr(edges))
+
+
+def test_index_arrays_are_int32(tmp_path):
+    src = str(tmp_path / "edges.tsv")
+    write_edge_list(src, messy_edges(), "\t")
+    for path in (ingest(src, str(tmp_path / "streamed")),
+                 write_csr(expected_csr(messy_edges()).astype(np.float32), str(tmp_path / "direct"))):
+        for mmap in (True, False):
+            csr = load_csr(path, mmap=mmap)
+            assert csr.indptr.dtype == csr.indices.dtype == np.int32
+            assert csr.data.dtype == np.float64
+    assert _index_dtype(10, 2 ** 31 - 2) == np.int32
+    assert _index_dtype(10, 2 ** 31) == np.int64
+    assert _index_dtype(2 ** 31, 10) == np.int64
+
+
+def mapped_file(array):
+    """File behind the np.memmap an array is a view of, or None when it is not mapped."""
+    while array is not None and not isinstance(array, np.memmap):
+        array = array.base if isinstance(array, np.ndarray) else None
+    return array.filename if array is not None else None
+
+
+def assert_shares_mapped_arrays(csr, mapped):
+    for name in ("indptr", "indices", "data"):
+        array = getattr(csr, name)
+        filename = mapped_file(array)
+        assert filename is not None and os.path.basename(filename) == f"{name}.npy"
+        assert np.shares_memory(array, getattr(mapped, name)) and not array.flags.writeable
+
+
+def test_mmap_graph_is_used_without_copies(tmp_path):
+    adj, _ = sbm_graph(300, 1, n_blocks=6)
+    path = write_csr(adj, str(tmp_path / "sbm"))
+    mapped = load_csr(path)
+    in_memory = load_csr(path, mmap=False)
+    assert mapped_file(in_memory.data) is None and in_memory.data.flags.writeable
+
+    # Every consumer reads the mapped arrays; a write or an upcast copy would fail these checks
+    assert_shares_mapped_arrays(mapped, mapped)
+    assert_shares_mapped_arrays(as_csr(mapped), mapped)
+
+    greedy = GreedySIOptimizer(mapped)
+    assert_shares_mapped_arrays(greedy.adj, mapped)
+    greedy.run(target_communities=6)
+    expected = GreedySIOptimizer(in_memory)
+    expected.run(target_communities=6)
+    assert greedy.partition == expected.partition
+
+    tree = PartitionTree(mapped)
+    assert_shares_mapped_arrays(tree.adj_matrix, mapped)
+    tree.build_encoding_tree(3)
+    expected = PartitionTree(in_memory)
+    expected.build_encoding_tree(3)
+    assert tree.entropy() == pytest.approx(expected.entropy(), abs=1e-12)
+
+    louvain = SILouvainOptimizer(mapped)
+    assert louvain.G is None
+    assert_shares_mapped_arrays(louvain.adj, mapped)
+    expected = SILouvainOptimizer(in_memory)
+    assert np.array_equal(louvain.run(seed=0), expected.run(seed=0))
+    assert louvain.get_total_entropy() == pytest.approx(expected.get_total_entropy(), abs=1e-12)
+
+    # The files were never written through the maps
+    assert_same_graph(load_csr(path), as_csr(adj))
@@ -0,0 +1,74 @@
+import os
+import random
+import sys
+
+import networkx as nx
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.si_base import StructuralEntropyBase
+
+
+def assert_matches_rebuild(se):
+    """Incrementally patched metrics must equal a fresh StructuralEntropyBase on the same graph and partition."""
+    fresh = StructuralEntropyBase(se.G.copy())
+    fresh.set_partition(se.partition)
+    assert se.W == pytest.approx(fresh.W)
+    for community in set(se.partition.values()):
+        assert se.V_C[community] == pytest.approx(fresh.V_C[community], abs=1e-9)
+        assert se.g_C[community] == pytest.approx(fresh.g_C[community], abs=1e-9)
+        assert se.dlog2d_per_community[community] == pytest.approx(fresh.dlog2d_per_community[community], abs=1e-9)
+    assert se.get_total_entropy() == pytest.approx(fresh.get_total_entropy(), abs=1e-9)
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_random_updates_match_rebuild(seed):
+    rng = random.Random(seed)
+    G = nx.connected_caveman_graph(4, 5)
+    for u, v in G.edges():
+        G[u][v]['weight'] = rng.choice([1, 2, 3])
+    se = StructuralEntropyBase(G)
+    se.set_partition({node: node // 5 for node in G.nodes()})
+    next_node = 100
+    for _ in range(80):
+        nodes = list(se.G.nodes())
+        op = rng.random()
+        if op < 0.35:
+            u, v = rng.choice(nodes), rng.choice(nodes)  # u == v adds a self-loop
+            se.add_edge(u, v, weight=rng.choice([1, 2, 5]))
+        elif op < 0.6 and se.G.number_of_edges() > 1:
+            se.remove_edge(*rng.choice(list(se.G.edges())))
+        elif op < 0.7:
+            se.add_edge(next_node, rng.choice(nodes))
+            next_node += 1
+        elif op < 0.8 and len(nodes) > 5:
+            se.remove_node(rng.choice(nodes))
+        else:
+            node = rng.choice(nodes)
+            target = se.partition[rng.choice(nodes)]
+            if target != se.partition[node]:
+                before = se.get_total_entropy()
+                delta = se._calculate_delta(node, target)
+                assert se._move_deltas(node, [target])[target] == pytest.approx(delta, abs=1e-9)
+                se._move_node(node, target)
+                assert se.get_total_entropy() - before == pytest.approx(delta, abs=1e-9)
+        assert_matches_rebuild(se)
+
+
+def test_reoptimize_repairs_locally():
+    G = nx.connected_caveman_graph(4, 5)
+    se = StructuralEntropyBase(G)
+    se.set_partition({node: node // 5 for node in G.nodes()})
+    # Rewire one clique member into the next clique
+    for v in list(G[4]):
+        se.remove_edge(4, v)
+    for v in range(5, 10):
+        se.add_edge(4, v)
+    before = se.get_total_entropy()
+    assert se.reoptimize() > 0
+    assert se.partition[4] == se.partition[5]
+    assert se.get_total_entropy() < before
+    assert_matches_rebuild(se)
+    # Local optimum: no node has an improving move left
+    assert all(se._best_community(node) == se.partition[node] for node in se.G.nodes())
@@ -0,0 +1,132 @@
+import copy
+import json
+import math
+import os
+import random
+import sys
+
+import networkx as nx
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web'))
+
+from app import LabManager, app, jsonify, lab_state, sessions, sip_cache
+from core.entropy import batch_entropy
+
+
+def se_2d(lab, partition):
+    """Unrounded se_2d of calculate_metrics: level degrees and cuts, G0's total volume."""
+    G = lab.get_current()["G"]
+    VOL = sum(d for _, d in lab.G0.degree(weight='weight'))
+    h = 0.0
+    for c in set(partition.values()):
+        members = [n for n in G.nodes() if partition[n] == c]
+        degrees = [d for _, d in G.degree(members, weight='weight')]
+        v = sum(degrees)
+        if v > 0:
+            h -= nx.cut_size(G, members, weight='weight') / VOL * math.log2(v / VOL)
+            h -= sum(d / VOL * math.log2(d / v) for d in degrees if d > 0)
+    return h
+
+
+def best_move_delta(lab):
+    """Lowest se_2d change over every (node, existing or new community) move, scored in one batch_entropy call."""
+    G = lab.get_current()["G"]
+    partition = lab.get_current()["partition"]
+    nodes = list(G.nodes())
+    targets = set(partition.values()) | {max(partition.values()) + 1}
+    rows = [[partition[m] for m in nodes]]
+    for i, n in enumerate(nodes):
+        for t in targets - {partition[n]}:
+            rows.append(rows[0][:i] + [t] + rows[0][i + 1:])
+    VOL = sum(d for _, d in lab.G0.degree(weight='weight'))
+    h = batch_entropy(G, np.array(rows), vol=VOL)
+    assert h[0] == pytest.approx(se_2d(lab, partition), abs=1e-12)
+    return min(0.0, (h[1:] - h[0]).min())
+
+
+@pytest.mark.parametrize("reweight", [False, True])
+def test_suggest_move_is_the_best_improving_move(reweight):
+    lab = LabManager()
+    lab.load_preset("karate")
+    if reweight:
+        # A zero-degree node and a level volume that differs from G0's
+        lab.update_edge("0", "11", 0.0)
+        lab.update_edge("32", "33", 5.0)
+    for _ in range(40):
+        move = lab.suggest_move()
+        best = best_move_delta(lab)
+        if move is None:
+            assert best > -1e-8
+            break
+        partition = lab.get_current()["partition"]
+        delta = se_2d(lab, {**partition, move[0]: move[1]}) - se_2d(lab, partition)
+        assert delta == pytest.approx(best, abs=1e-9)
+        lab.move_node(*move)
+    else:
+        pytest.fail("suggest_move did not converge")
+
+
+def test_move_deltas_match_calculate_delta():
+    lab = LabManager()
+    lab.load_preset("karate")
+    lab.set_partition({n: int(n) % 5 for n in lab.get_current()["G"].nodes()})
+    lab.suggest_move()
+    se = lab._scorer()
+    for n in se.G.nodes():
+        candidates = set(se.partition.values()) | {99}
+        for t, delta in se._move_deltas(n, candidates).items():
+            assert delta == pytest.approx(se._calculate_delta(n, t), abs=1e-12)
+
+
+def rebuilt(lab):
+    """A LabManager with the same levels and current level as `lab` but no cached state."""
+    fresh = LabManager()
+    fresh.G0 = lab.G0.copy()
+    fresh.levels = copy.deepcopy(lab.levels)
+    fresh.current_level = lab.current_level
+    fresh._reset_cache()
+    return fresh
+
+
+def random_op(client, lab, rng):
+    curr = lab.get_current()
+    nodes = list(curr["G"].nodes())
+    communities = sorted(set(curr["partition"].values()))
+    op = rng.random()
+    if op < 0.35:
+        client.post('/api/update_node', json={"id": rng.choice(nodes), "comm": rng.choice(communities + [max(communities) + 1])})
+    elif op < 0.5:
+        move = client.post('/api/suggest').json["best_move"]
+        if move is not None:
+            client.post('/api/update_node', json={"id": move["node"], "comm": move["to"]})
+    elif op < 0.65 and curr["G"].number_of_edges():
+        u, v = rng.choice(list(curr["G"].edges()))
+        client.post('/api/update_edge', json={"u": u, "v": v, "weight": rng.choice([0.0, 0.5, 2.0, 4.0])})
+    elif op < 0.8:
+        client.post('/api/merge')
+    elif op < 0.9:
+        client.post('/api/switch_level', json={"idx": rng.randrange(len(lab.levels))})
+    else:
+        with lab.lock:
+            lab.set_partition({n: rng.randrange(3) for n in nodes})
+
+
+@pytest.mark.parametrize("preset, seed", [("karate", 0), ("karate", 1), ("ring_cliques", 2), ("bridge", 3)])
+def test_cached_state_matches_a_fresh_lab(preset, seed):
+    rng = random.Random(seed)
+    client = app.test_client()
+    client.post('/api/preset', json={"type": preset})
+    with client.session_transaction() as sess:
+        lab = sessions.get(sess["sid"])
+    for _ in range(40):
+        random_op(client, lab, rng)
+        state = client.get('/api/state').json
+        if state["metrics"]["sip_pending"]:
+            sip_cache.wait(lab._g0_key, max(2, len(lab.levels)))
+            state = client.get('/api/state').json
+        with app.app_context():
+            expected = json.loads(jsonify(lab_state(rebuilt(lab))).get_data())
+        assert state == expected
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import networkx as nx
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.louvain_optimizer import SILouvainOptimizer
+
+
+def communities(partition):
+    return sorted(sorted(str(n) for n in partition if partition[n] == c) for c in set(partition.values()))
+
+
+@pytest.mark.parametrize("G", [
+    nx.karate_club_graph(),
+    nx.florentine_families_graph(),  # string node labels
+    nx.barabasi_albert_graph(200, 3, seed=1),
+], ids=["karate", "florentine", "ba200"])
+def test_python_and_numba_engines_agree(G):
+    python = SILouvainOptimizer(G)
+    numba = SILouvainOptimizer(G)
+    assert communities(python.run(engine='python')) == communities(numba.run(engine='numba'))
+    assert python.get_total_entropy() == pytest.approx(numba.get_total_entropy(), abs=1e-12)
+
+
+def test_karate_result():
+    optimizer = SILouvainOptimizer(nx.karate_club_graph())
+    partition = optimizer.run()
+    assert len(set(partition.values())) == 4
+    assert optimizer.get_total_entropy() == pytest.approx(3.278783, abs=1e-6)
@@ -0,0 +1,146 @@
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from core.lazy_heap import LazyHeap
+from core.leaf_order import leaf_ranges
+from graph_families import sbm_graph
+from sip import PartitionTree, TreeDepths, compressNode
+
+
+def subtree_leaves(node_dict, node_id):
+    """Vertices under node_id, collected by walking its children."""
+    node = node_dict[node_id]
+    if not node.children:
+        return list(node.partition)
+    return [v for child in node.children for v in subtree_leaves(node_dict, child)]
+
+
+def is_below(children, ancestor, node):
+    return node == ancestor or any(is_below(children, c, node) for c in children[ancestor])
+
+
+def height(node_dict, node_id):
+    """Longest path from node_id down to a leaf, walked directly."""
+    children = node_dict[node_id].children
+    return 1 + max(height(node_dict, c) for c in children) if children else 0
+
+
+def distance(node_dict, node_id):
+    """Edges from node_id up to the root, walked directly."""
+    d = 0
+    while node_dict[node_id].parent is not None:
+        node_id = node_dict[node_id].parent
+        d += 1
+    return d
+
+
+def build_tree(N, k, mode='v2', seed=1, **kwargs):
+    adj, _ = sbm_graph(N, seed, n_blocks=6)
+    tree = PartitionTree(adj, **kwargs)
+    tree.build_encoding_tree(k, mode=mode)
+    return tree
+
+
+def test_leaf_ranges_are_subtree_slices():
+    children = {0: [1, 2], 1: [3, 4], 2: [], 3: [], 4: [], 5: [6], 6: []}
+    items = {2: [20, 21], 3: [30], 4: [40, 41, 42], 6: [60]}
+    order, ranges = leaf_ranges([0, 5], children.get, items.get)
+    assert order.tolist() == [30, 40, 41, 42, 20, 21, 60]
+    assert order.dtype == np.int64
+    for node_id in children:
+        start, end = ranges[node_id]
+        leaves = [v for n in children if n in items and is_below(children, node_id, n) for v in items[n]]
+        assert sorted(order[start:end].tolist()) == sorted(leaves)
+
+
+@pytest.mark.parametrize("k, mode", [(2, 'v2'), (3, 'v2'), (4, 'v2'), (3, 'v1')])
+def test_partitions_are_leaf_order_slices(k, mode):
+    tree = build_tree(300, k, mode)
+    nodes = tree.tree_node
+    root = nodes[tree.root_id].partition
+    assert sorted(root.tolist()) == list(range(300))
+    for node_id, node in nodes.items():
+        assert sorted(node.partition) == sorted(subtree_leaves(nodes, node_id))
+        if node.children:
+            # Internal nodes view the root's leaf order and cannot be written through
+            assert isinstance(node.partition, np.ndarray) and node.partition.base is root.base
+            assert not node.partition.flags.writeable
+
+
+def test_tree_depths_match_a_direct_walk():
+    tree = build_tree(300, None, mode='v1')
+    nodes = tree.tree_node
+    depth = TreeDepths(nodes, tree.root_id)
+    rng = random.Random(0)
+    while True:
+        internal = [i for i, n in nodes.items() if n.children]
+        for i in internal:
+            assert nodes[i].child_h == height(nodes, i)
+            assert depth(i) == distance(nodes, i) + height(nodes, i)
+        candidates = [i for i in internal if i != tree.root_id]
+        if not candidates:
+            break
+        node_id = rng.choice(candidates)
+        compressNode(nodes, node_id, nodes[node_id].parent)
+        depth.compress(node_id)
+
+
+@pytest.mark.parametrize("k", [3, 4, 5])
+def test_compressed_tree_height(k):
+    full = build_tree(600, None, mode='v1')
+    tree = build_tree(600, k, mode='v1')
+    nodes = tree.tree_node
+    assert height(nodes, tree.root_id) == nodes[tree.root_id].child_h == min(k, height(full.tree_node, full.root_id))
+    assert sorted(subtree_leaves(nodes, tree.root_id)) == list(range(600))
+    # Compression only removes levels, so the entropy cannot drop below the uncompressed tree's
+    assert tree.entropy() >= full.entropy() - 1e-9
+
+
+def test_lazy_heap_skips_stale_entries_and_compacts():
+    rng = random.Random(0)
+    live = set(range(2000))
+    heap = LazyHeap(lambda e: e[1] in live, [(rng.random(), i) for i in live], min_compact_size=64)
+    for i in rng.sample(sorted(live), 1500):
+        live.discard(i)
+        heap.invalidate()
+    assert heap.compactions > 0 and len(heap) < 2000
+    expected = [e for e in heap.heap if e[1] in live]
+    for i in range(2000, 2100):
+        live.add(i)
+        e = (rng.random(), i)
+        heap.push(e)
+        expected.append(e)
+    popped = []
+    while (e := heap.pop()) is not None:
+        popped.append(e)
+    assert popped == sorted(expected)
+
+
+def tree_signature(tree):
+    return sorted((i, n.parent, sorted(n.children or ()), sorted(int(v) for v in n.partition), n.child_h,
+                   round(n.vol, 9), round(n.g, 9)) for i, n in tree.tree_node.items())
+
+
+@pytest.mark.parametrize("k", [3, 4])
+def test_leaf_up_workers_build_the_same_tree(k):
+    serial = build_tree(400, k, workers=1)
+    parallel = build_tree(400, k, workers=2, profile=True)
+    assert parallel.stats.counters["leaf_up_subproblems"] > 1
+    assert parallel.root_id == serial.root_id
+    assert tree_signature(parallel) == tree_signature(serial)
+    assert parallel.entropy() == pytest.approx(serial.entropy(), abs=1e-12)
+
+
+def test_adj_table_is_deprecated_but_available():
+    adj, _ = sbm_graph(100, 1, n_blocks=4)
+    tree = PartitionTree(adj)
+    with pytest.warns(DeprecationWarning):
+        table = tree.adj_table
+    assert table == {i: set(adj[i].indices.tolist()) for i in range(100)}
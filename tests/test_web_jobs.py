@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web'))
+
+import app as web
+from app import app, check_job_params, sessions
+
+
+def new_client(preset="karate"):
+    client = app.test_client()
+    client.post('/api/preset', json={"type": preset})
+    return client
+
+
+def session_lab(client):
+    with client.session_transaction() as sess:
+        return sessions.get(sess["sid"])
+
+
+def wait_job(client, job_id, timeout=60):
+    """Poll a job until it finishes; returns its final state and every progress value seen."""
+    seen = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/api/jobs/{job_id}').json
+        seen.append(job["progress"])
+        if job["status"] in ("done", "failed", "cancelled"):
+            return job, seen
+        time.sleep(0.02)
+    pytest.fail(f"job {job_id} did not finish")
+
+
+def wait_status(client, job_id, status, timeout=10):
+    deadline = time.monotonic() + timeout
+    while client.get(f'/api/jobs/{job_id}').json["status"] != status:
+        if time.monotonic() > deadline:
+            pytest.fail(f"job {job_id} never became {status}")
+        time.sleep(0.01)
+
+
+def test_sessions_are_isolated():
+    a, b = new_client("karate"), new_client("bridge")
+    a.post('/api/update_node', json={"id": "0", "comm": 1})
+    assert session_lab(a) is not session_lab(b)
+    state_a, state_b = a.get('/api/state').json, b.get('/api/state').json
+    assert state_a["partition"]["0"] == 1
+    assert set(state_b["partition"]) == {"A1", "A2", "A3", "B1", "B2", "B3"}
+    # Jobs are only visible to the session that submitted them
+    job = a.post('/api/jobs', json={"kind": "suggest"}).json
+    assert b.get(f'/api/jobs/{job["id"]}').status_code == 404
+    assert b.post(f'/api/jobs/{job["id"]}/cancel').status_code == 404
+    assert wait_job(a, job["id"])[0]["status"] == "done"
+
+
+@pytest.mark.parametrize("kind, params", [
+    ("suggest", {}),
+    ("sip", {"k": 3}),
+    ("louvain", {"seed": 1}),
+    ("monte_carlo", {"n_runs": 8, "seed": 1, "max_workers": 1}),
+])
+def test_job_kinds_finish(kind, params):
+    client = new_client()
+    response = client.post('/api/jobs', json={"kind": kind, "params": params})
+    assert response.status_code == 202
+    assert response.json["progress"] == 0
+    job, seen = wait_job(client, response.json["id"])
+    assert job["status"] == "done", job["error"]
+    assert seen == sorted(seen) and seen[-1] == 1
+    if kind == "suggest":
+        assert job["result"]["best_move"] is not None
+    elif kind == "sip":
+        assert job["result"]["k"] == 3 and job["result"]["sip_optimal"] > 0
+    else:
+        assert set(job["result"]["partition"]) == set(session_lab(client).get_current()["G"].nodes())
+    if kind == "monte_carlo":
+        assert len(job["result"]["entropies"]) == 8
+        assert job["result"]["entropy"] == pytest.approx(min(job["result"]["entropies"]))
+
+
+def test_cancel_queued_job():
+    client = new_client()
+    lab = session_lab(client)
+    # Holding the lab lock parks the jobs that fill the pool, so the next one stays queued
+    with lab.lock:
+        blockers = [client.post('/api/jobs', json={"kind": "suggest"}).json["id"] for _ in range(2)]
+        for job_id in blockers:
+            wait_status(client, job_id, "running")
+        queued = client.post('/api/jobs', json={"kind": "suggest"}).json
+        assert queued["status"] == "queued"
+        assert client.post(f'/api/jobs/{queued["id"]}/cancel').json["status"] == "cancelled"
+    for job_id in blockers:
+        assert wait_job(client, job_id)[0]["status"] == "done"
+    job = client.get(f'/api/jobs/{queued["id"]}').json
+    assert job["status"] == "cancelled" and job["result"] is None
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_cancel_running_monte_carlo(monkeypatch, max_workers):
+    monkeypatch.setattr(web, "MAX_MC_WORKERS", 2)
+    client = new_client()
+    lab = session_lab(client)
+    # The job starts, then waits for the lab lock; it is cancelled before its first progress report
+    with lab.lock:
+        job = client.post('/api/jobs', json={"kind": "monte_carlo",
+                                             "params": {"n_runs": 50, "max_workers": max_workers}}).json
+        wait_status(client, job["id"], "running")
+        assert client.post(f'/api/jobs/{job["id"]}/cancel').json["status"] == "running"
+    job, _ = wait_job(client, job["id"])
+    assert job["status"] == "cancelled" and job["result"] is None
+
+
+@pytest.mark.parametrize("kind, params", [
+    ("monte_carlo", {"n_runs": 0}),
+    ("monte_carlo", {"n_runs": 10 ** 6}),
+    ("louvain", {"n_runs": "5"}),
+    ("louvain", {"n_runs": True}),
+    ("monte_carlo", {"max_workers": 10 ** 4}),
+    ("sip", {"k": 1}),
+    ("sip", {"k": 1000}),
+    ("sip", {"k": 2.5}),
+])
+def test_out_of_range_params_are_rejected(kind, params):
+    assert check_job_params(kind, params) is not None
+    response = new_client().post('/api/jobs', json={"kind": kind, "params": params})
+    assert response.status_code == 400 and "error" in response.json
+
+
+def test_valid_and_malformed_params():
+    assert check_job_params("monte_carlo", {"n_runs": 10, "max_workers": 1}) is None
+    assert check_job_params("sip", {"k": 4}) is None
+    assert check_job_params("suggest", {"k": -1}) is None
+    client = new_client()
+    assert client.post('/api/jobs', json={"kind": "louvain", "params": [1]}).status_code == 400
+    assert client.post('/api/jobs', json={"kind": "nope"}).status_code == 400
@@ -1,12 +1,22 @@
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, jsonify, request, render_template, session
 import networkx as nx
 import math
+import multiprocessing as mp
 import os
 import sys
+import hashlib
+import threading
+import uuid
 import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # Add benchmarks to path to import sip.py
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'benchmarks'))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.louvain_optimizer import SILouvainOptimizer
+from core.si_base import StructuralEntropyBase
+from core.sparse_graph import aggregate_graph, as_csr, group_adjacency
 try:
     import sip
     SIP_AVAILABLE = True
@@ -15,6 +25,8 @@ except ImportError:
 
 app = Flask(__name__, 
             template_folder=os.path.join(os.path.dirname(__file__), 'templates'))
+# Signs the session cookie that maps each browser to its own LabManager
+app.secret_key = os.environ.get("SI_LAB_SECRET_KEY") or os.urandom(24)
 
 # --- Metrics Definitions ---
 METRIC_DEFS = {
@@ -32,13 +44,96 @@ METRIC_DEFS = {
     }
 }
 
+def graph_key(G):
+    """Content hash of a weighted graph (sorted nodes, edges and weights), independent of insertion order."""
+    h = hashlib.sha256()
+    h.update(repr(sorted(str(n) for n in G.nodes())).encode())
+    edges = sorted((*sorted((str(u), str(v))), float(d.get('weight', 1))) for u, v, d in G.edges(data=True))
+    h.update(repr(edges).encode())
+    return h.hexdigest()
+
+def compute_sip_optimal(G, k):
+    nodes = sorted(list(G.nodes()))
+    adj = nx.to_scipy_sparse_array(G, nodelist=nodes, weight='weight')
+    
+    pt = sip.PartitionTree(adj)
+    pt.build_encoding_tree(k)
+    return round(pt.entropy(), 6)
+
+class SIPCache:
+    """
+    LRU cache of SIP-optimal entropies keyed by (graph content hash, k).
+    A miss schedules the computation on a background worker and returns None
+    at once; later lookups return the value once it is ready.
+    """
+    def __init__(self, maxsize=32, max_workers=1):
+        self.maxsize = maxsize
+        self._results = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sip")
+
+    def get(self, key, G, k):
+        """(value, pending) for graph G with content hash `key`; G is copied if a computation is scheduled."""
+        with self._lock:
+            if (key, k) in self._results:
+                self._results.move_to_end((key, k))
+                return self._results[(key, k)], False
+            if (key, k) not in self._pending:
+                self._pending[(key, k)] = self._pool.submit(self._compute, key, G.copy(), k)
+            return None, True
+
+    def _compute(self, key, G, k):
+        try:
+            value = compute_sip_optimal(G, k)
+        except Exception as e:
+            print(f"SIP Error: {e}")
+            value = None
+        with self._lock:
+            # Failures are stored too, so a broken graph is not recomputed on every poll
+            self._results[(key, k)] = value
+            self._results.move_to_end((key, k))
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+            del self._pending[(key, k)]
+        return value
+
+    def wait(self, key, k, timeout=None):
+        """Block until a scheduled computation finishes (returns immediately if none is pending)."""
+        with self._lock:
+            future = self._pending.get((key, k))
+        if future is not None:
+            future.result(timeout)
+
+sip_cache = SIPCache()
+
 class LabManager:
     def __init__(self):
+        self.lock = threading.RLock() # held by request handlers and jobs while they touch the lab
         self.levels = []
         self.current_level = 0
         self.G0 = None
         self.load_preset("bridge")
 
+    def _reset_cache(self):
+        self._g0_csr = None        # (node index, CSR adjacency, weighted degrees, row sums) of G0
+        self._level_stats = {}     # level -> {node: (leafs, v, g)} measured on G0
+        self._comm_stats = None    # {cid: (leafs, v, g)} for the current-partition layer
+        self._tree = None
+        self._metrics = {}         # level -> calculate_metrics() result
+        self._scorers = {}         # level -> StructuralEntropyBase that suggest_move scores with
+        self._g0_key = graph_key(self.G0)  # content hash for the shared SIP cache
+
+    def _invalidate(self, level):
+        """Drop everything derived from the partition of `level` and the levels above it."""
+        for l in [l for l in self._level_stats if l > level]:
+            del self._level_stats[l]
+        for l in [l for l in self._scorers if l > level]:
+            del self._scorers[l]
+        self._comm_stats = None
+        self._tree = None
+        self._metrics.clear()
+
     def load_preset(self, type):
         if type == "bridge":
             G = nx.Graph()
@@ -61,6 +156,8 @@ class LabManager:
             G = nx.complete_graph(4) # 4 nodes, H = log2(4) = 2.0
         elif type == "path_4":
             G = nx.path_graph(4) # 4 nodes
+        elif type == "planted_1k":
+            G = nx.planted_partition_graph(10, 100, 0.1, 0.005, seed=42) # 10 x 100-node communities
         else:
             G = nx.ring_of_cliques(4, 4)
         
@@ -72,8 +169,11 @@ class LabManager:
         
         self.G0 = G.copy()
         partition = {n: i for i, n in enumerate(G.nodes())}
-        self.levels = [{"G": G.copy(), "partition": partition, "label": "L0: Nodes"}]
+        # "leafs" maps every level node to the G0 node indices below it
+        leafs = {n: np.array([i], dtype=np.int64) for i, n in enumerate(G.nodes())}
+        self.levels = [{"G": G.copy(), "partition": partition, "leafs": leafs, "label": "L0: Nodes"}]
         self.current_level = 0
+        self._reset_cache()
 
     def get_current(self):
         return self.levels[self.current_level]
@@ -81,33 +181,115 @@ class LabManager:
     def move_node(self, node_id, target_comm):
         curr = self.get_current()
         curr["partition"][node_id] = int(target_comm)
+        se = self._scorers.get(self.current_level)
+        # Zero-degree nodes are not in the scorer (see _scorer)
+        if se is not None and node_id in se.partition and se.partition[node_id] != int(target_comm):
+            se._move_node(node_id, int(target_comm))
         if self.current_level < len(self.levels) - 1:
             self.levels = self.levels[:self.current_level+1]
+        self._invalidate(self.current_level)
+
+    def set_partition(self, partition):
+        """Replace the current level's partition (e.g. with an optimizer result), like a batch of move_node calls."""
+        curr = self.get_current()
+        curr["partition"] = {n: int(partition[n]) for n in curr["G"].nodes()}
+        if self.current_level < len(self.levels) - 1:
+            self.levels = self.levels[:self.current_level+1]
+        self._scorers.pop(self.current_level, None)
+        self._invalidate(self.current_level)
+
+    def update_edge(self, u, v, weight):
+        """Reweight an edge of the current level graph; the tree is measured on G0, so only this level's metrics change."""
+        G = self.get_current()["G"]
+        if G.has_edge(u, v):
+            G[u][v]['weight'] = weight
+            self._metrics.pop(self.current_level, None)
+            self._scorers.pop(self.current_level, None)
+
+    def _g0_arrays(self):
+        """(G0 node list, CSR adjacency, weighted degrees, row sums), built once per preset."""
+        if self._g0_csr is None:
+            adj = as_csr(self.G0)
+            row_sum = np.asarray(adj.sum(axis=1)).ravel()
+            self._g0_csr = (list(self.G0.nodes()), adj, row_sum + adj.diagonal(), row_sum)
+        return self._g0_csr
+
+    def _group_stats(self, groups):
+        """(leafs, v, g) on G0 for each {id: leaf index array} group, from one CSR pass over their rows."""
+        nodes, adj, degree, row_sum = self._g0_arrays()
+        ids = list(groups)
+        members = [groups[i] for i in ids]
+        # Edges leave a group unless both ends are inside it
+        inner = group_adjacency(adj, members).diagonal()
+        return {i: ([nodes[k] for k in m.tolist()], float(degree[m].sum()), float(row_sum[m].sum() - inner[j]))
+                for j, (i, m) in enumerate(zip(ids, members))}
+
+    def get_level_stats(self, level):
+        """{node: (leafs, v, g)} for the nodes of `level`, from the leaf arrays stored with the level."""
+        if level not in self._level_stats:
+            self._level_stats[level] = self._group_stats(self.levels[level]["leafs"])
+        return self._level_stats[level]
+
+    def suggest_move(self):
+        """
+        Best single-node move (node, target community) at the current level, or None.
+        Each node x neighbour-community move is scored from one O(deg) scan of the node
+        (_move_deltas) on the level's cached scorer, so a call costs O(sum of degrees).
+        """
+        partition = self.get_current()["partition"]
+        se = self._scorer()
+        if se is None:
+            return None
+        new_comm = max(partition.values()) + 1 if partition else 0
+
+        best_move, best_delta = None, -1e-8
+        for n in se.G.nodes():
+            candidates = dict.fromkeys([partition[nb] for nb in se.G.neighbors(n)] + [new_comm])
+            for t, delta in se._move_deltas(n, candidates).items():
+                if delta < best_delta:
+                    best_move, best_delta = (n, t), delta
+        return best_move
+
+    def _scorer(self):
+        """
+        StructuralEntropyBase of the current level for suggest_move, kept up to date by
+        move_node and rebuilt after set_partition / update_edge. Deltas are on the se_2d
+        scale of calculate_metrics: normalized by G0's total volume (the level's own 2W
+        drifts after update_edge) and without zero-degree nodes, which se_2d skips
+        rather than counting as unit volume. None if G0 has no edge weight.
+        """
+        if self.current_level not in self._scorers:
+            vol_total = sum(dict(self.G0.degree(weight='weight')).values())
+            if vol_total <= 0:
+                return None
+            curr = self.get_current()
+            G, partition = curr["G"], curr["partition"]
+            active = [n for n, d in G.degree(weight='weight') if d > 0]
+            # A copy, not a subgraph view: views filter every adjacency lookup
+            se = StructuralEntropyBase(G if len(active) == len(G) else G.subgraph(active).copy())
+            se.W = vol_total / 2.0
+            se.set_partition({n: partition[n] for n in active})
+            self._scorers[self.current_level] = se
+        return self._scorers[self.current_level]
 
     def get_encoding_tree(self):
+        if self._tree is None:
+            self._tree = self._build_encoding_tree()
+        return self._tree
+
+    def _build_encoding_tree(self):
         tree_elements = []
         total_vol = sum(dict(self.G0.degree(weight='weight')).values())
-        
-        def get_l0_leafs(level_idx, node_id):
-            if level_idx == 0:
-                return [node_id]
-            prev_level = self.levels[level_idx - 1]
-            children = [nid for nid, cid in prev_level["partition"].items() if str(cid) == str(node_id)]
-            leafs = []
-            for c in children:
-                leafs.extend(get_l0_leafs(level_idx - 1, c))
-            return leafs
 
         # 1. Add layers G0...Gk
         for l_idx, lvl in enumerate(self.levels):
             G_lvl = lvl["G"]
             partition = lvl["partition"]
+            stats = self.get_level_stats(l_idx)
             
             for node in G_lvl.nodes():
                 tree_id = f"L{l_idx}_{node}"
-                leafs = get_l0_leafs(l_idx, node)
-                v_alpha = sum(dict(self.G0.degree(leafs, weight='weight')).values())
-                g_alpha = nx.cut_size(self.G0, leafs, weight='weight')
+                leafs, v_alpha, g_alpha = stats[node]
                 
                 # The parent is either the community in the next level, 
                 # OR if this is the top level Gk, the parent is the community id or Root
@@ -136,15 +318,15 @@ class LabManager:
         
         root_level = len(self.levels)
         if not is_comm_redundant:
+            if self._comm_stats is None:
+                # Leafs of the Lk nodes in each cid
+                lk_leafs = curr_lvl["leafs"]
+                members = {cid: [] for cid in unique_comms}
+                for lk_n, c in partition.items():
+                    members[c].append(lk_leafs[lk_n])
+                self._comm_stats = self._group_stats({cid: np.concatenate(m) for cid, m in members.items()})
             for cid in unique_comms:
-                # Nodes in Lk that belong to this cid
-                lk_nodes = [nid for nid, c in partition.items() if c == cid]
-                all_leafs = []
-                for lk_n in lk_nodes:
-                    all_leafs.extend(get_l0_leafs(len(self.levels)-1, lk_n))
-                
-                v_c = sum(dict(self.G0.degree(all_leafs, weight='weight')).values())
-                g_c = nx.cut_size(self.G0, all_leafs, weight='weight')
+                all_leafs, v_c, g_c = self._comm_stats[cid]
                 
                 tree_elements.append({
                     "id": f"Comm_{cid}", "label": f"Comm {cid}", 
@@ -195,42 +377,49 @@ class LabManager:
         
         if num_comms >= num_nodes:
             return False
+        # The new level is built from this one, so any levels above it are replaced
+        self.levels = self.levels[:self.current_level+1]
 
-        new_G = nx.Graph()
         comm_nodes = {}
         for n, c in partition.items():
             if c not in comm_nodes: comm_nodes[c] = []
             comm_nodes[c].append(n)
         
         new_nodes = sorted(comm_nodes.keys())
-        new_G.add_nodes_from([str(c) for c in new_nodes])
-        
-        # Aggregate weights and INCLUDE SELF-LOOPS for modularity/volume consistency
-        for i, c1 in enumerate(new_nodes):
-            for j, c2 in enumerate(new_nodes):
-                if i > j: continue
-                w = 0
-                for u in comm_nodes[c1]:
-                    for v in comm_nodes[c2]:
-                        if G.has_edge(u, v):
-                            w += G[u][v]['weight']
-                
-                if w > 0:
-                    # For self-loops (i==j), we've counted internal edges twice (u-v and v-u).
-                    # NetworkX degree() counts self-loop weight twice, so we set weight = sum(internal)/2
-                    actual_w = w / 2.0 if i == j else w
-                    new_G.add_edge(str(c1), str(c2), weight=actual_w)
+        # Aggregate weights in O(E); internal weight (self-loops included) becomes a
+        # self-loop, so each super-node's degree equals its community volume
+        new_G = nx.relabel_nodes(aggregate_graph(G, partition, communities=new_nodes), str)
 
         new_partition = {str(n): idx for idx, n in enumerate(new_G.nodes())}
+        # Cumulative leaf arrays of the new nodes
+        leafs = {str(c): np.concatenate([curr["leafs"][n] for n in comm_nodes[c]]) for c in new_nodes}
         self.levels.append({
             "G": new_G, 
             "partition": new_partition, 
+            "leafs": leafs,
             "label": f"L{len(self.levels)}: Aggregated"
         })
         self.current_level = len(self.levels) - 1
+        # Everything above the level the new one was built from is stale
+        self._invalidate(self.current_level - 1)
         return True
 
     def calculate_metrics(self, partition_override=None):
+        if partition_override is None:
+            if self.current_level not in self._metrics:
+                self._metrics[self.current_level] = self._calculate_metrics()
+            metrics = self._metrics[self.current_level]
+            if SIP_AVAILABLE and metrics["sip_optimal"] is None:
+                self._fill_sip(metrics)
+            return metrics
+        return self._calculate_metrics(partition_override)
+
+    def _fill_sip(self, metrics):
+        """Look up the SIP reference for G0 and the current depth without blocking on it."""
+        k = max(2, len(self.levels))
+        metrics["sip_optimal"], metrics["sip_pending"] = sip_cache.get(self._g0_key, self.G0, k)
+
+    def _calculate_metrics(self, partition_override=None):
         curr = self.get_current()
         G = curr["G"]
         partition = partition_override if partition_override is not None else curr["partition"]
@@ -290,25 +479,8 @@ class LabManager:
         root_node = next(n for n in tree_elements if n["id"] == "Root")
         h_tree_total = root_node["subtree_total_h"]
 
-        # SIP Validation
-        sip_val = None
-        if SIP_AVAILABLE and not partition_override:
-            try:
-                nodes = sorted(list(self.G0.nodes()))
-                node_to_idx = {n: i for i, n in enumerate(nodes)}
-                size = len(nodes)
-                adj = np.zeros((size, size))
-                for u, v, d in self.G0.edges(data=True):
-                    i, j = node_to_idx[u], node_to_idx[v]
-                    w = d.get('weight', 1.0)
-                    adj[i,j] = adj[j,i] = w
-                
-                pt = sip.PartitionTree(adj)
-                k = max(2, len(self.levels))
-                pt.build_encoding_tree(k)
-                sip_val = round(pt.entropy(), 6)
-            except Exception as e:
-                print(f"SIP Error: {e}")
+        # SIP Validation (filled in by the background worker, see _fill_sip)
+        sip_val, sip_pending = None, False
 
         return {
             "se_1d_base": round(se_1d_base, 6),
@@ -318,13 +490,193 @@ class LabManager:
             "q": round(mod_q, 6), 
             "vol_total": vol_total,
             "traces": traces,
-            "sip_optimal": sip_val
+            "sip_optimal": sip_val,
+            "sip_pending": sip_pending
         }
 
-lab = LabManager()
+class SessionStore:
+    """One LabManager per browser session, least recently used evicted beyond maxsize."""
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._labs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            if sid not in self._labs:
+                self._labs[sid] = LabManager()
+                while len(self._labs) > self.maxsize:
+                    self._labs.popitem(last=False)
+            self._labs.move_to_end(sid)
+            return self._labs[sid]
+
+sessions = SessionStore()
+
+def current_lab():
+    if "sid" not in session:
+        session["sid"] = uuid.uuid4().hex
+    return sessions.get(session["sid"])
+
+# --- Background jobs ---
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    def __init__(self, kind, owner):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner = owner
+        self.status = "queued" # queued -> running -> done / failed / cancelled
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    def report(self, done, total=1):
+        """Record progress; raises JobCancelled once cancellation was requested."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.progress = done / total if total else 1.0
+
+    def to_dict(self):
+        return {"id": self.id, "kind": self.kind, "status": self.status,
+                "progress": round(self.progress, 4), "result": self.result, "error": self.error}
+
+class JobManager:
+    """
+    Runs lab jobs on a thread pool. fn(job, *args) does the work and reports progress
+    via job.report(); a job can be cancelled while queued or at its next report().
+    Finished jobs beyond max_jobs are forgotten oldest first.
+    """
+    def __init__(self, max_workers=2, max_jobs=256):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="lab-job")
+
+    def submit(self, kind, owner, fn, *args):
+        job = Job(kind, owner)
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [j for j in self._jobs.values() if j.status in ("done", "failed", "cancelled")]
+            for old in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+                del self._jobs[old.id]
+        job.future = self._pool.submit(self._run, job, fn, *args)
+        return job
+
+    def _run(self, job, fn, *args):
+        if job._cancel.is_set():
+            job.status = "cancelled"
+            return
+        job.status = "running"
+        try:
+            job.result = fn(job, *args)
+            job.progress = 1.0
+            job.status = "done"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+
+    def get(self, job_id, owner):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job if job is not None and job.owner == owner else None
+
+    def cancel(self, job_id, owner):
+        job = self.get(job_id, owner)
+        if job is not None:
+            job._cancel.set()
+            if job.future.cancel():
+                job.status = "cancelled"
+        return job
+
+jobs = JobManager()
+
+def _compact_labels(partition, nodes):
+    """Relabel communities 0..C-1 in order of first appearance (lab partitions are ints)."""
+    index = {}
+    return {n: index.setdefault(partition[n], len(index)) for n in nodes}
+
+def job_suggest(job, lab):
+    with lab.lock:
+        move = lab.suggest_move()
+    return {"best_move": None if move is None else {"node": move[0], "to": int(move[1])}}
+
+def job_sip(job, lab, params):
+    with lab.lock:
+        key, G0 = lab._g0_key, lab.G0
+        k = params.get("k") or max(2, len(lab.levels))
+    value, pending = sip_cache.get(key, G0, k)
+    if pending:
+        sip_cache.wait(key, k)
+        value, _ = sip_cache.get(key, G0, k)
+    return {"sip_optimal": value, "k": k}
+
+# Server-side limits for client-supplied job sizes
+MAX_SIP_K = 10
+MAX_MC_RUNS = 1000
+MAX_MC_WORKERS = os.cpu_count() or 1
+# Monte-Carlo workers are spawned: forking this process would copy it mid-way through
+# its Flask, lab-job and SIP threads
+MC_CONTEXT = mp.get_context("spawn")
+
+def check_job_params(kind, params):
+    """Error message if a job's params are out of range, else None (checked before the job is queued)."""
+    limits = {"sip": (("k", 2, MAX_SIP_K),),
+              "louvain": (("n_runs", 1, MAX_MC_RUNS), ("max_workers", 1, MAX_MC_WORKERS))}
+    limits["monte_carlo"] = limits["louvain"]
+    for name, minimum, maximum in limits.get(kind, ()):
+        value = params.get(name)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, int) or not minimum <= value <= maximum:
+            return f"{name} must be an integer from {minimum} to {maximum}"
+    return None
+
+def job_louvain(job, lab, params):
+    """Louvain (best-of-n_runs Monte-Carlo Louvain if n_runs is given) on the current level; "apply" writes the result back."""
+    with lab.lock:
+        level = lab.current_level
+        G = lab.get_current()["G"].copy()
+    optimizer = SILouvainOptimizer(G)
+    n_runs = params.get("n_runs")
+    result = {}
+    if n_runs is not None:
+        _, entropies = optimizer.run_monte_carlo(n_runs=n_runs, seed=params.get("seed"),
+                                                 max_workers=params.get("max_workers") or MAX_MC_WORKERS,
+                                                 progress=job.report, mp_context=MC_CONTEXT)
+        result["entropies"] = entropies
+    else:
+        optimizer.run(engine=params.get("engine", "numba"), seed=params.get("seed"))
+    job.report(1)
+    partition = _compact_labels(optimizer.partition, list(G.nodes()))
+    result.update({"partition": partition, "entropy": optimizer.get_total_entropy(), "level": level, "applied": False})
+
+    if params.get("apply"):
+        with lab.lock:
+            # Only apply if the level still has the graph the job ran on
+            if lab.current_level == level and set(lab.get_current()["G"].nodes()) == set(partition):
+                lab.set_partition(partition)
+                result["applied"] = True
+    return result
+
+JOB_KINDS = {
+    "suggest": lambda job, lab, params: job_suggest(job, lab),
+    "sip": job_sip,
+    "louvain": job_louvain,
+    "monte_carlo": lambda job, lab, params: job_louvain(job, lab, {"n_runs": 100, **params}),
+}
 
 @app.route('/api/state')
 def api_state():
+    lab = current_lab()
+    with lab.lock:
+        return jsonify(lab_state(lab))
+
+def lab_state(lab):
     curr = lab.get_current()
     metrics = lab.calculate_metrics()
     
@@ -349,7 +701,7 @@ def api_state():
                 "weight": d.get('weight', 1.0)
             })
 
-    return jsonify({
+    return {
         "elements": elements, 
         "partition": curr["partition"], 
         "metrics": metrics, 
@@ -358,62 +710,76 @@ def api_state():
         "current_idx": lab.current_level,
         "tree": lab.get_encoding_tree(),
         "level_edges": all_level_edges
-    })
+    }
 
 @app.route('/api/switch_level', methods=['POST'])
 def switch_level():
-    lab.current_level = int(request.json['idx'])
+    lab = current_lab()
+    with lab.lock:
+        lab.current_level = int(request.json['idx'])
     return jsonify({"status": "ok"})
 
 @app.route('/api/update_node', methods=['POST'])
 def update_node():
-    lab.move_node(request.json['id'], request.json['comm'])
+    lab = current_lab()
+    with lab.lock:
+        lab.move_node(request.json['id'], request.json['comm'])
     return jsonify({"status": "ok"})
 
 @app.route('/api/update_edge', methods=['POST'])
 def update_edge():
     u, v, w = request.json['u'], request.json['v'], float(request.json['weight'])
-    curr = lab.get_current()
-    if curr["G"].has_edge(u, v): curr["G"][u][v]['weight'] = w
+    lab = current_lab()
+    with lab.lock:
+        lab.update_edge(u, v, w)
     return jsonify({"status": "ok"})
 
 @app.route('/api/merge', methods=['POST'])
 def api_merge():
-    success = lab.merge_to_next_level()
+    lab = current_lab()
+    with lab.lock:
+        success = lab.merge_to_next_level()
     return jsonify({"status": "ok" if success else "failed"})
 
 @app.route('/api/preset', methods=['POST'])
 def api_preset():
-    lab.load_preset(request.json['type'])
+    lab = current_lab()
+    with lab.lock:
+        lab.load_preset(request.json['type'])
     return jsonify({"status": "ok"})
 
 @app.route('/api/suggest', methods=['POST'])
 def api_suggest():
-    curr = lab.get_current()
-    G, partition = curr["G"], curr["partition"]
-    base_metrics = lab.calculate_metrics()
-    base_se = base_metrics["se_2d"]
-    
-    import random
-    nodes = list(G.nodes())
-    random.shuffle(nodes)
-    
-    test_partition = partition.copy()
-    
-    for n in nodes:
-        old_comm = test_partition[n]
-        neigh_comms = {test_partition[nb] for nb in G.neighbors(n)}
-        if test_partition:
-             neigh_comms.add(max(test_partition.values()) + 1)
-        
-        for t in neigh_comms:
-            if t == old_comm: continue
-            test_partition[n] = t
-            new_m = lab.calculate_metrics(partition_override=test_partition)
-            if new_m["se_2d"] < base_se - 1e-8:
-                return jsonify({"best_move": {"node": n, "to": int(t)}})
-            test_partition[n] = old_comm
-    return jsonify({"best_move": None})
+    return jsonify(job_suggest(None, current_lab()))
+
+@app.route('/api/jobs', methods=['POST'])
+def api_submit_job():
+    kind = request.json.get('kind')
+    if kind not in JOB_KINDS:
+        return jsonify({"error": f"Unknown job kind: {kind}", "kinds": sorted(JOB_KINDS)}), 400
+    params = request.json.get('params') or {}
+    error = "params must be an object" if not isinstance(params, dict) else check_job_params(kind, params)
+    if error:
+        return jsonify({"error": error}), 400
+    lab = current_lab()
+    job = jobs.submit(kind, session["sid"], JOB_KINDS[kind], lab, params)
+    return jsonify(job.to_dict()), 202
+
+@app.route('/api/jobs/<job_id>')
+def api_job(job_id):
+    current_lab()
+    job = jobs.get(job_id, session["sid"])
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def api_cancel_job(job_id):
+    current_lab()
+    job = jobs.cancel(job_id, session["sid"])
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
 
 @app.route('/api/wiki/<name>')
 def api_wiki(name):